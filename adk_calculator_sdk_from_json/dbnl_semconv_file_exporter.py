@@ -1,8 +1,56 @@
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 import json
+import queue
+import threading
+import time
 from collections import defaultdict
 from datetime import datetime
 
+# Serialized traces are written to the file by a background thread. Export blocks
+# once WRITER_QUEUE_SIZE lines are waiting; the file is flushed when
+# WRITER_FLUSH_BYTES are unflushed or the oldest unflushed line is
+# WRITER_FLUSH_INTERVAL_S old, whichever comes first.
+WRITER_QUEUE_SIZE = 1024
+WRITER_FLUSH_BYTES = 1 << 20
+WRITER_FLUSH_INTERVAL_S = 1.0
+
+_STOP_WRITER = object()
+
+# Span attributes read for the trace-level metrics, in priority order. Token
+# counts take the first key that parses as a number.
+TOTAL_TOKEN_KEYS = (
+    "gen_ai.usage.total_tokens",
+    "llm.token_count.total",
+    "token_count.total",
+)
+PROMPT_TOKEN_KEYS = (
+    "gen_ai.usage.input_tokens",
+    "llm.token_count.prompt",
+    "token_count.prompt",
+    "prompt_tokens",
+)
+COMPLETION_TOKEN_KEYS = (
+    "gen_ai.usage.output_tokens",
+    "llm.token_count.completion",
+    "token_count.completion",
+    "completion_tokens",
+)
+SESSION_ID_KEYS = (
+    "session.id",
+    "session_id",
+    "ai.session.id",
+    "app.session.id",
+    "user.session.id",
+    "gcp.vertex.agent.session_id",
+)
+TOOL_CALL_KEYS = (
+    "tool.name",
+    "gen_ai.tool.name",
+    "function.name",
+    "gen_ai.request.tool_calls",
+)
+LLM_CALL_KEYS = ("gen_ai.system", "gen_ai.request.model", "llm.model_name")
+
 # Model pricing in USD per 1M tokens (prompt / completion)
 # Source: https://ai.google.dev/pricing
 MODEL_PRICING = {
@@ -24,12 +72,41 @@ MODEL_PRICING = {
 
 
 class DBNLSemConvFileExporter(SpanExporter):
-    def __init__(self, file_path):
+    def __init__(
+        self,
+        file_path,
+        queue_size=WRITER_QUEUE_SIZE,
+        flush_bytes=WRITER_FLUSH_BYTES,
+        flush_interval_s=WRITER_FLUSH_INTERVAL_S,
+    ):
         self.file_path = file_path
         self.file = open(file_path, "a")
         self.traces = defaultdict(list)  # Group spans by trace_id
 
+        self.flush_bytes = flush_bytes
+        self.flush_interval_s = flush_interval_s
+        # Backpressure: the deepest the queue has been, and how many traces had
+        # to wait for room in it
+        self.max_queue_depth = 0
+        self.queue_full_waits = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = False
+        self._writer_error = None  # exception that stopped the writer thread
+        self._writer = threading.Thread(
+            target=self._write_lines, name="DBNLSemConvFileWriter", daemon=True
+        )
+        self._writer.start()
+
+    @property
+    def queue_depth(self):
+        """Serialized traces waiting for the writer thread."""
+        return self._queue.qsize()
+
     def export(self, spans):
+        if self._closed:
+            return SpanExportResult.FAILURE
+        self._check_writer()
+
         # First pass: collect all spans by trace_id with their metadata
         spans_by_trace = defaultdict(list)
         span_data_by_id = {}  # Store span data for parent lookups
@@ -809,15 +886,7 @@ class DBNLSemConvFileExporter(SpanExporter):
                     oi_attrs["input.mime_type"] = "application/json"
 
         # Session and User IDs
-        session_id_keys = [
-            "session.id",
-            "session_id",
-            "ai.session.id",
-            "app.session.id",
-            "user.session.id",
-            "gcp.vertex.agent.session_id",
-        ]
-        for key in session_id_keys:
+        for key in SESSION_ID_KEYS:
             if key in attributes:
                 oi_attrs["session.id"] = attributes[key]
                 break
@@ -920,13 +989,17 @@ class DBNLSemConvFileExporter(SpanExporter):
 
         return oi_attributes
 
-    def _extract_input(self, root_span, trace_spans):
-        """Extract the input from the root span or child spans"""
+    def _extract_input(self, root_span, attributes, sorted_spans):
+        """
+        Extract the input from the root span or child spans
+
+        attributes are the root span's, and sorted_spans the (span, attributes)
+        pairs in start_time order, as returned by _visit_spans.
+        """
         if not root_span:
             return ""
 
         # First check root span attributes (now OpenInference format)
-        attributes = self._key_value_list_to_dict(root_span.get("attributes", []))
 
         # Check for OpenInference input.value first (already extracted)
         if "input.value" in attributes and attributes["input.value"]:
@@ -967,11 +1040,7 @@ class DBNLSemConvFileExporter(SpanExporter):
                     return str(event_attrs["input"])
 
         # If not found in root span, search for the first LLM span's input (user query)
-        # Sort spans by start_time to get chronological order
-        sorted_spans = sorted(trace_spans, key=lambda s: s.get("start_time", ""))
-
-        for span in sorted_spans:
-            span_attrs = self._key_value_list_to_dict(span.get("attributes", []))
+        for span, span_attrs in sorted_spans:
             span_kind = span.get("kind")
 
             # Only look at LLM spans for the trace-level input
@@ -999,9 +1068,7 @@ class DBNLSemConvFileExporter(SpanExporter):
                 return input_val
 
         # Fallback: if no LLM span found, look at all spans
-        for span in sorted_spans:
-            span_attrs = self._key_value_list_to_dict(span.get("attributes", []))
-
+        for span, span_attrs in sorted_spans:
             if "input.value" in span_attrs and span_attrs["input.value"]:
                 input_val = span_attrs["input.value"]
                 mime_type = span_attrs.get("input.mime_type", "application/json")
@@ -1106,13 +1173,16 @@ class DBNLSemConvFileExporter(SpanExporter):
         # Default to empty string if no input found
         return ""
 
-    def _extract_output(self, root_span, trace_spans):
-        """Extract the output from the root span or child spans"""
+    def _extract_output(self, root_span, attributes, sorted_spans):
+        """
+        Extract the output from the root span or child spans
+
+        Takes the same arguments as _extract_input.
+        """
         if not root_span:
             return ""
 
         # First check root span attributes (now OpenInference format)
-        attributes = self._key_value_list_to_dict(root_span.get("attributes", []))
 
         # Check for OpenInference output.value first (already extracted)
         if "output.value" in attributes and attributes["output.value"]:
@@ -1155,22 +1225,18 @@ class DBNLSemConvFileExporter(SpanExporter):
                 elif "response" in event_attrs:
                     return str(event_attrs["response"])
 
-        # If not found in root span, search for the last LLM span's output (final answer)
-        # Sort spans by start_time and search in reverse to get the last LLM output
-        sorted_spans = sorted(trace_spans, key=lambda s: s.get("start_time", ""))
+        # If not found in root span, search in reverse start_time order to get the
+        # last LLM output (final answer)
 
         # First priority: Find the last LLM span (the actual agent response to user)
         last_llm_span = None
-        for span in reversed(sorted_spans):
+        for span, span_attrs in reversed(sorted_spans):
             if span.get("kind") == "LLM":
                 last_llm_span = span
                 break
 
         # If we found the last LLM span and it has output.value, use it (even if empty string)
         if last_llm_span:
-            span_attrs = self._key_value_list_to_dict(
-                last_llm_span.get("attributes", [])
-            )
             if "output.value" in span_attrs:
                 output_val = span_attrs["output.value"]
                 mime_type = span_attrs.get("output.mime_type", "application/json")
@@ -1193,8 +1259,7 @@ class DBNLSemConvFileExporter(SpanExporter):
                 return output_val
 
         # Fallback: if last LLM span had no output.value, look for earlier LLM spans with output
-        for span in reversed(sorted_spans):
-            span_attrs = self._key_value_list_to_dict(span.get("attributes", []))
+        for span, span_attrs in reversed(sorted_spans):
             span_kind = span.get("kind")
 
             if (
@@ -1221,9 +1286,7 @@ class DBNLSemConvFileExporter(SpanExporter):
                 return output_val
 
         # Final fallback: if no LLM spans found with output, look at all other spans in reverse order
-        for span in reversed(sorted_spans):
-            span_attrs = self._key_value_list_to_dict(span.get("attributes", []))
-
+        for span, span_attrs in reversed(sorted_spans):
             if "output.value" in span_attrs and span_attrs["output.value"]:
                 output_val = span_attrs["output.value"]
                 mime_type = span_attrs.get("output.mime_type", "application/json")
@@ -1353,149 +1416,80 @@ class DBNLSemConvFileExporter(SpanExporter):
 
         return None
 
-    def _extract_total_token_count(self, trace_spans):
-        """Extract the total token count from all spans in the trace"""
-        total_tokens = 0
-
-        # Token attribute keys to look for
-        total_token_keys = [
-            "gen_ai.usage.total_tokens",
-            "llm.token_count.total",
-            "token_count.total",
-        ]
-
-        input_token_keys = [
-            "gen_ai.usage.input_tokens",
-            "llm.token_count.prompt",
-            "token_count.prompt",
-        ]
-
-        output_token_keys = [
-            "gen_ai.usage.output_tokens",
-            "llm.token_count.completion",
-            "token_count.completion",
-        ]
-
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-            span_tokens = 0
-
-            # First try to get total tokens directly
-            for key in total_token_keys:
-                if key in attributes:
-                    value = attributes[key]
-                    try:
-                        span_tokens = int(float(value))
-                        break
-                    except (ValueError, TypeError):
-                        continue
-
-            # If no total found, try to sum input + output tokens
-            if span_tokens == 0:
-                input_tokens = 0
-                output_tokens = 0
-
-                for key in input_token_keys:
-                    if key in attributes:
-                        value = attributes[key]
-                        try:
-                            input_tokens = int(float(value))
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                for key in output_token_keys:
-                    if key in attributes:
-                        value = attributes[key]
-                        try:
-                            output_tokens = int(float(value))
-                            break
-                        except (ValueError, TypeError):
-                            continue
-
-                span_tokens = input_tokens + output_tokens
-
-            total_tokens += span_tokens
-
-        return total_tokens
-
-    def _extract_prompt_token_count(self, trace_spans):
-        """Extract the total prompt/input token count from all spans in the trace"""
-        prompt_tokens = 0
-
-        input_token_keys = [
-            "gen_ai.usage.input_tokens",
-            "llm.token_count.prompt",
-            "token_count.prompt",
-            "prompt_tokens",
-        ]
-
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-
-            for key in input_token_keys:
-                if key in attributes:
-                    value = attributes[key]
-                    try:
-                        prompt_tokens += int(float(value))
-                        break
-                    except (ValueError, TypeError):
-                        continue
-
-        return prompt_tokens
-
-    def _extract_completion_token_count(self, trace_spans):
-        """Extract the total completion/output token count from all spans in the trace"""
-        completion_tokens = 0
-
-        output_token_keys = [
-            "gen_ai.usage.output_tokens",
-            "llm.token_count.completion",
-            "token_count.completion",
-            "completion_tokens",
-        ]
-
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-
-            for key in output_token_keys:
-                if key in attributes:
-                    value = attributes[key]
-                    try:
-                        completion_tokens += int(float(value))
-                        break
-                    except (ValueError, TypeError):
-                        continue
-
-        return completion_tokens
-
-    def _extract_tool_metrics(self, trace_spans):
-        """Extract tool call metrics from all spans in the trace"""
-        tool_call_count = 0
-        tool_call_error_count = 0
+    def _visit_spans(self, trace_spans):
+        """
+        Compute the trace-level metrics in one pass over the spans
+
+        Each span's attributes are converted to a dict once and the spans are
+        sorted by start_time once. Besides the metrics, the result holds the root
+        span (the first without a parent), its attributes, and "sorted_spans",
+        the (span, attributes) pairs in start_time order.
+        """
+        visited = []  # (span, attributes, call sequence label or None)
+        root_span = None
+        root_attributes = {}
+        session_id = ""
+        total_token_count = prompt_token_count = completion_token_count = 0
+        prompt_cost = completion_cost = 0.0
+        tool_call_count = tool_call_error_count = 0
         tool_call_name_counts = {}
+        llm_call_count = llm_call_error_count = 0
+        llm_call_model_counts = {}
+        error_messages = []
+        has_success = False
 
         for span in trace_spans:
             attributes = self._key_value_list_to_dict(span.get("attributes", []))
             span_kind = span.get("kind", "")
+            if root_span is None and span["parent_span_id"] is None:
+                root_span, root_attributes = span, attributes
+            if not session_id:
+                session_id = self._find_session_id(attributes)
+
+            # Tokens: the per-span total, else input + output from the gen_ai and
+            # llm usage keys (the bare prompt_tokens/completion_tokens only count
+            # toward the prompt and completion totals)
+            span_prompt_tokens = self._first_int(attributes, PROMPT_TOKEN_KEYS)
+            span_completion_tokens = self._first_int(attributes, COMPLETION_TOKEN_KEYS)
+            prompt_token_count += span_prompt_tokens
+            completion_token_count += span_completion_tokens
+            span_tokens = self._first_int(attributes, TOTAL_TOKEN_KEYS)
+            if span_tokens == 0:
+                span_tokens = self._first_int(
+                    attributes, PROMPT_TOKEN_KEYS[:-1]
+                ) + self._first_int(attributes, COMPLETION_TOKEN_KEYS[:-1])
+            total_token_count += span_tokens
+
+            # Status: any error makes the trace an error, listing every failed span
+            status = span.get("status", {})
+            status_code = status.get("code", "UNSET")
+            if status_code == "ERROR":
+                span_name = span.get("name", "unknown")
+                status_message = status.get("message", "")
+                if status_message:
+                    error_messages.append(f"{span_name}: {status_message}")
+                else:
+                    error_messages.append(f"{span_name} failed")
+            elif status_code == "OK":
+                has_success = True
 
             # Identify tool call spans (ADK uses gen_ai.operation.name == 'execute_tool')
             is_tool_call = (
                 span_kind == "TOOL"
                 or attributes.get("gen_ai.operation.name") == "execute_tool"
-                or "tool.name" in attributes
-                or "gen_ai.tool.name" in attributes
-                or "function.name" in attributes
-                or "gen_ai.request.tool_calls" in attributes
+                or any(key in attributes for key in TOOL_CALL_KEYS)
                 or "tool_call" in span.get("name", "").lower()
             )
+            # Identify LLM call spans
+            is_llm_call = (
+                span_kind == "LLM"
+                or any(key in attributes for key in LLM_CALL_KEYS)
+                or "llm" in span.get("name", "").lower()
+            )
 
+            call_label = None
             if is_tool_call:
                 tool_call_count += 1
-
-                # Check for errors
-                status = span.get("status", {})
-                status_code = status.get("code", "UNSET")
                 if status_code == "ERROR":
                     tool_call_error_count += 1
 
@@ -1504,208 +1498,93 @@ class DBNLSemConvFileExporter(SpanExporter):
                     attributes.get("gen_ai.tool.name")
                     or attributes.get("tool.name")
                     or attributes.get("function.name")
-                    or attributes.get("gen_ai.tool.name")
                     or span.get("name", "unknown")
                 )
-
-                # Count tool names
                 if tool_name:
                     tool_call_name_counts[tool_name] = (
                         tool_call_name_counts.get(tool_name, 0) + 1
                     )
-
-        return {
-            "tool_call_count": tool_call_count,
-            "tool_call_error_count": tool_call_error_count,
-            "tool_call_name_counts": tool_call_name_counts,
-        }
-
-    def _extract_llm_metrics(self, trace_spans):
-        """Extract LLM call metrics from all spans in the trace"""
-        llm_call_count = 0
-        llm_call_error_count = 0
-        llm_call_model_counts = {}
-
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-            span_kind = span.get("kind", "")
-
-            # Identify LLM call spans
-            is_llm_call = (
-                span_kind == "LLM"
-                or "gen_ai.system" in attributes
-                or "gen_ai.request.model" in attributes
-                or "llm.model_name" in attributes
-                or "llm" in span.get("name", "").lower()
-            )
+                call_label = f"tool:{tool_name}"
 
             if is_llm_call:
                 llm_call_count += 1
-
-                # Check for errors
-                status = span.get("status", {})
-                status_code = status.get("code", "UNSET")
                 if status_code == "ERROR":
                     llm_call_error_count += 1
 
-                # Extract model name
                 model_name = (
                     attributes.get("gen_ai.request.model")
                     or attributes.get("gen_ai.response.model")
                     or attributes.get("llm.model_name")
                     or attributes.get("gen_ai.system")
                 )
-
-                # Count model names
                 if model_name:
                     llm_call_model_counts[model_name] = (
                         llm_call_model_counts.get(model_name, 0) + 1
                     )
 
-        return {
-            "llm_call_count": llm_call_count,
-            "llm_call_error_count": llm_call_error_count,
-            "llm_call_model_counts": llm_call_model_counts,
-        }
-
-    def _extract_call_sequence(self, trace_spans):
-        """Extract the sequence of tool and LLM calls from the trace"""
-        calls = []
-
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-            span_kind = span.get("kind", "")
-            start_time = span.get("start_time")
-
-            # Check if this is a tool call (ADK uses gen_ai.operation.name == 'execute_tool')
-            is_tool_call = (
-                span_kind == "TOOL"
-                or attributes.get("gen_ai.operation.name") == "execute_tool"
-                or "tool.name" in attributes
-                or "gen_ai.tool.name" in attributes
-                or "function.name" in attributes
-                or "gen_ai.request.tool_calls" in attributes
-                or "tool_call" in span.get("name", "").lower()
-            )
-
-            # Check if this is an LLM call
-            is_llm_call = (
-                span_kind == "LLM"
-                or "gen_ai.system" in attributes
-                or "gen_ai.request.model" in attributes
-                or "llm.model_name" in attributes
-                or "llm" in span.get("name", "").lower()
-            )
-
-            if is_tool_call:
-                tool_name = (
-                    attributes.get("gen_ai.tool.name")
-                    or attributes.get("tool.name")
-                    or attributes.get("function.name")
-                    or span.get("name", "unknown")
-                )
-                calls.append(
-                    {
-                        "type": "tool",
-                        "name": tool_name,
-                        "start_time": start_time,
-                        "label": f"tool:{tool_name}",
-                    }
-                )
-            elif is_llm_call:
-                model_name = (
-                    attributes.get("gen_ai.request.model")
-                    or attributes.get("gen_ai.response.model")
-                    or attributes.get("llm.model_name")
-                    or attributes.get("gen_ai.system")
-                    or "unknown"
-                )
-                calls.append(
-                    {
-                        "type": "llm",
-                        "name": model_name,
-                        "start_time": start_time,
-                        "label": f"llm:{model_name}",
-                    }
-                )
-
-        # Sort by start_time to get the chronological sequence
-        # Note: start_time is now ISO 8601 string, but should still sort correctly
-        calls.sort(key=lambda x: x["start_time"] if x["start_time"] else "")
-
-        # Extract just the labels for the sequence
-        sequence = [call["label"] for call in calls]
-
-        return sequence
-
-    def _extract_trace_status(self, trace_spans):
-        """Extract the overall trace status from all spans"""
-        # Check all spans for errors
-        error_spans = []
-        has_success = False
-
-        for span in trace_spans:
-            status = span.get("status", {})
-            status_code = status.get("code", "UNSET")
-
-            if status_code == "ERROR":
-                span_name = span.get("name", "unknown")
-                status_message = status.get("message", "")
-                error_spans.append({"name": span_name, "message": status_message})
-            elif status_code == "OK":
-                has_success = True
+                    # Calculate costs (pricing is per 1M tokens)
+                    pricing = self._get_model_pricing(model_name)
+                    if pricing:
+                        prompt_cost += (span_prompt_tokens / 1_000_000) * pricing[
+                            "prompt"
+                        ]
+                        completion_cost += (
+                            span_completion_tokens / 1_000_000
+                        ) * pricing["completion"]
 
-        # If any span has an error, trace status is ERROR
-        if error_spans:
-            # Build error message listing all failed operations
-            error_messages = []
-            for error_span in error_spans:
-                if error_span["message"]:
-                    error_messages.append(
-                        f"{error_span['name']}: {error_span['message']}"
-                    )
-                else:
-                    error_messages.append(f"{error_span['name']} failed")
+                # A span that is both is listed as a tool call in the sequence
+                if call_label is None:
+                    call_label = f"llm:{model_name or 'unknown'}"
 
-            return {"status": "ERROR", "status_message": "; ".join(error_messages)}
+            visited.append((span, attributes, call_label))
 
-        # If all spans are successful or unset
-        return {"status": "OK" if has_success else "UNSET", "status_message": ""}
+        # Stable sort, so spans with equal start_time keep their export order
+        visited.sort(key=lambda v: v[0].get("start_time") or "")
 
-    def _extract_session_id(self, root_span, trace_spans):
-        """Extract the session ID from the root span or child spans"""
-        if not root_span:
-            return ""
+        if error_messages:
+            status, status_message = "ERROR", "; ".join(error_messages)
+        else:
+            status, status_message = "OK" if has_success else "UNSET", ""
 
-        # First check root span attributes
-        attributes = self._key_value_list_to_dict(root_span.get("attributes", []))
-
-        # Try various common attribute names for session ID
-        session_id_keys = [
-            "session.id",
-            "session_id",
-            "ai.session.id",
-            "app.session.id",
-            "user.session.id",
-            "gcp.vertex.agent.session_id",
-        ]
+        return {
+            "root_span": root_span,
+            "root_attributes": root_attributes,
+            "sorted_spans": [(span, attributes) for span, attributes, _ in visited],
+            # The root span's session id wins over the first one in export order
+            "session_id": self._find_session_id(root_attributes) or session_id,
+            "status": status,
+            "status_message": status_message,
+            "total_token_count": total_token_count,
+            "prompt_token_count": prompt_token_count,
+            "completion_token_count": completion_token_count,
+            "total_cost": prompt_cost + completion_cost,
+            "prompt_cost": prompt_cost,
+            "completion_cost": completion_cost,
+            "tool_call_count": tool_call_count,
+            "tool_call_error_count": tool_call_error_count,
+            "tool_call_name_counts": tool_call_name_counts,
+            "llm_call_count": llm_call_count,
+            "llm_call_error_count": llm_call_error_count,
+            "llm_call_model_counts": llm_call_model_counts,
+            "call_sequence": [label for _, _, label in visited if label is not None],
+        }
 
-        for key in session_id_keys:
+    def _first_int(self, attributes, keys):
+        """First of keys whose value parses as a number, as an int (0 if none)"""
+        for key in keys:
             if key in attributes:
-                value = attributes[key]
-                if value:
-                    return str(value)
-
-        # If not found in root span, search all spans
-        for span in trace_spans:
-            span_attrs = self._key_value_list_to_dict(span.get("attributes", []))
-            for key in session_id_keys:
-                if key in span_attrs:
-                    value = span_attrs[key]
-                    if value:
-                        return str(value)
-
-        # Default to empty string if no session ID found
+                try:
+                    return int(float(attributes[key]))
+                except (ValueError, TypeError):
+                    continue
+        return 0
+
+    def _find_session_id(self, attributes):
+        """First non-empty session id attribute, as a string ("" if none)"""
+        for key in SESSION_ID_KEYS:
+            value = attributes.get(key)
+            if value:
+                return str(value)
         return ""
 
     def _get_model_pricing(self, model_name):
@@ -1727,121 +1606,26 @@ class DBNLSemConvFileExporter(SpanExporter):
         # No pricing found
         return None
 
-    def _calculate_costs(self, trace_spans):
-        """Calculate cost estimates based on token usage and models used"""
-        total_prompt_cost = 0.0
-        total_completion_cost = 0.0
-
-        # Input/output token keys
-        input_token_keys = [
-            "gen_ai.usage.input_tokens",
-            "llm.token_count.prompt",
-            "token_count.prompt",
-            "prompt_tokens",
-        ]
-
-        output_token_keys = [
-            "gen_ai.usage.output_tokens",
-            "llm.token_count.completion",
-            "token_count.completion",
-            "completion_tokens",
-        ]
-
-        # Process each LLM span
-        for span in trace_spans:
-            attributes = self._key_value_list_to_dict(span.get("attributes", []))
-            span_kind = span.get("kind", "")
-
-            # Identify LLM call spans
-            is_llm_call = (
-                span_kind == "LLM"
-                or "gen_ai.system" in attributes
-                or "gen_ai.request.model" in attributes
-                or "llm.model_name" in attributes
-                or "llm" in span.get("name", "").lower()
-            )
-
-            if is_llm_call:
-                # Extract model name
-                model_name = (
-                    attributes.get("gen_ai.request.model")
-                    or attributes.get("gen_ai.response.model")
-                    or attributes.get("llm.model_name")
-                    or attributes.get("gen_ai.system")
-                )
-
-                # Get pricing for this model
-                pricing = self._get_model_pricing(model_name) if model_name else None
-
-                if pricing:
-                    # Extract token counts for this span
-                    prompt_tokens = 0
-                    completion_tokens = 0
-
-                    for key in input_token_keys:
-                        if key in attributes:
-                            value = attributes[key]
-                            try:
-                                prompt_tokens = int(float(value))
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    for key in output_token_keys:
-                        if key in attributes:
-                            value = attributes[key]
-                            try:
-                                completion_tokens = int(float(value))
-                                break
-                            except (ValueError, TypeError):
-                                continue
-
-                    # Calculate costs (pricing is per 1M tokens)
-                    span_prompt_cost = (prompt_tokens / 1_000_000) * pricing["prompt"]
-                    span_completion_cost = (completion_tokens / 1_000_000) * pricing[
-                        "completion"
-                    ]
-
-                    total_prompt_cost += span_prompt_cost
-                    total_completion_cost += span_completion_cost
-
-        total_cost = total_prompt_cost + total_completion_cost
-
-        return {
-            "total_cost": total_cost,
-            "prompt_cost": total_prompt_cost,
-            "completion_cost": total_completion_cost,
-        }
-
     def _write_trace(self, trace_id, trace_spans):
         """Write a complete trace object to the output file"""
         # Extract all metrics from spans
-        root_span = next((s for s in trace_spans if s["parent_span_id"] is None), None)
-        input_value = self._extract_input(root_span, trace_spans) if root_span else ""
-        output_value = self._extract_output(root_span, trace_spans) if root_span else ""
+        metrics = self._visit_spans(trace_spans)
+        root_span = metrics["root_span"]
+        root_attributes = metrics["root_attributes"]
+        sorted_spans = metrics["sorted_spans"]
+        input_value = (
+            self._extract_input(root_span, root_attributes, sorted_spans)
+            if root_span
+            else ""
+        )
+        output_value = (
+            self._extract_output(root_span, root_attributes, sorted_spans)
+            if root_span
+            else ""
+        )
         timestamp = self._extract_timestamp(root_span) if root_span else None
         duration_ms = self._extract_duration_ms(root_span) if root_span else None
-        session_id = (
-            self._extract_session_id(root_span, trace_spans) if root_span else ""
-        )
-        total_token_count = self._extract_total_token_count(trace_spans)
-        prompt_token_count = self._extract_prompt_token_count(trace_spans)
-        completion_token_count = self._extract_completion_token_count(trace_spans)
-
-        # Extract tool call metrics
-        tool_metrics = self._extract_tool_metrics(trace_spans)
-
-        # Extract LLM call metrics
-        llm_metrics = self._extract_llm_metrics(trace_spans)
-
-        # Extract call sequence
-        call_sequence = self._extract_call_sequence(trace_spans)
-
-        # Extract trace-level status
-        trace_status = self._extract_trace_status(trace_spans)
-
-        # Calculate costs
-        costs = self._calculate_costs(trace_spans)
+        session_id = metrics["session_id"] if root_span else ""
 
         # Decode session_id (it's JSON-encoded from span attributes)
         # input/output are already JSON-encoded from span attributes, keep as-is
@@ -1859,30 +1643,110 @@ class DBNLSemConvFileExporter(SpanExporter):
             "output": output_value if output_value else "",
             "timestamp": timestamp,
             "duration_ms": duration_ms,
-            "status": trace_status["status"],
-            "status_message": trace_status["status_message"],
-            "total_token_count": total_token_count,
-            "prompt_token_count": prompt_token_count,
-            "completion_token_count": completion_token_count,
-            "total_cost": costs["total_cost"],
-            "prompt_cost": costs["prompt_cost"],
-            "completion_cost": costs["completion_cost"],
-            "tool_call_count": tool_metrics["tool_call_count"],
-            "tool_call_error_count": tool_metrics["tool_call_error_count"],
-            "tool_call_name_counts": tool_metrics["tool_call_name_counts"],
-            "llm_call_count": llm_metrics["llm_call_count"],
-            "llm_call_error_count": llm_metrics["llm_call_error_count"],
-            "llm_call_model_counts": llm_metrics["llm_call_model_counts"],
-            "call_sequence": call_sequence,
+            "status": metrics["status"],
+            "status_message": metrics["status_message"],
+            "total_token_count": metrics["total_token_count"],
+            "prompt_token_count": metrics["prompt_token_count"],
+            "completion_token_count": metrics["completion_token_count"],
+            "total_cost": metrics["total_cost"],
+            "prompt_cost": metrics["prompt_cost"],
+            "completion_cost": metrics["completion_cost"],
+            "tool_call_count": metrics["tool_call_count"],
+            "tool_call_error_count": metrics["tool_call_error_count"],
+            "tool_call_name_counts": metrics["tool_call_name_counts"],
+            "llm_call_count": metrics["llm_call_count"],
+            "llm_call_error_count": metrics["llm_call_error_count"],
+            "llm_call_model_counts": metrics["llm_call_model_counts"],
+            "call_sequence": metrics["call_sequence"],
             "spans": trace_spans,
         }
 
         json_line = json.dumps(trace_object) + "\n"
-        self.file.write(json_line)
-        self.file.flush()
+        self._enqueue(json_line)
+
+    def _check_writer(self):
+        """Raise the writer thread's error if it has stopped."""
+        if self._writer_error is not None:
+            raise self._writer_error
+        if not self._writer.is_alive():
+            raise RuntimeError(f"Writer thread for {self.file_path} stopped")
+
+    def _enqueue(self, item):
+        """Hand an item to the writer thread, waiting while the queue is full."""
+        self._check_writer()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.queue_full_waits += 1
+            while True:
+                try:
+                    self._queue.put(item, timeout=self.flush_interval_s)
+                    break
+                except queue.Full:
+                    self._check_writer()
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+
+    def _write_lines(self):
+        """Writer thread: append queued lines, flushing on size or age."""
+        try:
+            self._write_queued_lines()
+        except BaseException as error:
+            # Raised again from export, force_flush and shutdown
+            self._writer_error = error
+
+    def _write_queued_lines(self):
+        unflushed = 0
+        flush_deadline = None
+        while True:
+            timeout = None
+            if flush_deadline is not None:
+                timeout = max(flush_deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, str):
+                self.file.write(item)
+                unflushed += len(item)
+                if flush_deadline is None:
+                    flush_deadline = time.monotonic() + self.flush_interval_s
+                if unflushed < self.flush_bytes and time.monotonic() < flush_deadline:
+                    continue
+
+            self.file.flush()
+            unflushed = 0
+            flush_deadline = None
+            if isinstance(item, threading.Event):
+                item.set()  # force_flush waiting on it
+            elif item is _STOP_WRITER:
+                return
+
+    def force_flush(self, timeout_millis=30000):
+        """Wait until every trace written so far has been flushed to the file."""
+        if self._closed:
+            return False
+        flushed = threading.Event()
+        self._enqueue(flushed)
+        deadline = time.monotonic() + timeout_millis / 1000
+        while not flushed.wait(min(self.flush_interval_s, deadline - time.monotonic())):
+            self._check_writer()
+            if time.monotonic() >= deadline:
+                return False
+        return True
 
     def shutdown(self):
         """Write any remaining traces on shutdown"""
-        for trace_id, trace_spans in self.traces.items():
-            self._write_trace(trace_id, trace_spans)
-        self.file.close()
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            for trace_id, trace_spans in self.traces.items():
+                self._write_trace(trace_id, trace_spans)
+            self.traces.clear()
+            self._enqueue(_STOP_WRITER)
+            self._writer.join()
+        finally:
+            self.file.close()
+        if self._writer_error is not None:
+            raise self._writer_error
@@ -0,0 +1,159 @@
+"""Time grouping collector payloads by trace id, before and after interning."""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from dbnl_otel_converter import group_resource_spans_by_trace_id
+
+RESOURCES = [
+    {"attributes": [{"key": "service.name", "value": {"stringValue": name}}]}
+    for name in ("calculator", "calculator-b")
+]
+SCOPES = [
+    {"name": "openinference.instrumentation.google_adk", "version": "0.1.6"},
+    {"name": "calculator_tools", "version": "1.0"},
+]
+
+
+def write_synthetic_file(path, traces, traces_per_payload, seed=0):
+    """Write collector JSONL with an LLM and a tool span per trace and scope."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for first in range(0, traces, traces_per_payload):
+            count = min(traces_per_payload, traces - first)
+            payload = {"resourceSpans": []}
+            for resource in RESOURCES:
+                scope_spans = []
+                for scope in SCOPES:
+                    spans = [
+                        span
+                        for i in range(first, first + count)
+                        for span in _trace_spans(rng, i)
+                    ]
+                    scope_spans.append({"scope": scope, "spans": spans})
+                payload["resourceSpans"].append(
+                    {"resource": resource, "scopeSpans": scope_spans}
+                )
+            f.write(json.dumps(payload) + "\n")
+
+
+def _trace_spans(rng, i):
+    # Same trace ids for every resource/scope, so traces span all four buckets
+    trace_id = "%032x" % random.Random(i).getrandbits(128)
+    start = 1_700_000_000_000_000_000 + i * 10_000_000_000
+    return [
+        {
+            "traceId": trace_id,
+            "spanId": "%016x" % rng.getrandbits(64),
+            "name": name,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + rng.randint(1_000_000, 900_000_000)),
+            "attributes": [
+                {"key": "openinference.span.kind", "value": {"stringValue": kind}}
+            ],
+        }
+        for name, kind in (("call_llm", "LLM"), ("execute_tool add", "TOOL"))
+    ]
+
+
+def group_by_serializing(payloads):
+    """The grouping as it was: json.dumps every resource/scope, json.loads back."""
+    grouped = defaultdict(dict)
+    for payload in payloads:
+        for rs in payload.get("resourceSpans", []):
+            resource = rs.get("resource", {})
+            resource_key = json.dumps(resource, sort_keys=True)
+            for ss in rs.get("scopeSpans", []):
+                scope = ss.get("scope", {})
+                scope_key = json.dumps(scope, sort_keys=True)
+                for span in ss.get("spans", []):
+                    trace_id = span.get("traceId")
+                    if trace_id is None:
+                        continue
+                    bucket = grouped[trace_id].setdefault(
+                        (resource_key, scope_key),
+                        {"resource": resource, "scope": scope, "spans": []},
+                    )
+                    bucket["spans"].append(span)
+
+    traces_by_id = {}
+    for trace_id, rs_scope_map in grouped.items():
+        by_resource = defaultdict(list)
+        for info in rs_scope_map.values():
+            by_resource[json.dumps(info["resource"], sort_keys=True)].append(info)
+        resource_spans = []
+        for res_key, scope_infos in by_resource.items():
+            by_scope = defaultdict(list)
+            for info in scope_infos:
+                by_scope[json.dumps(info["scope"], sort_keys=True)].extend(
+                    info["spans"]
+                )
+            resource_spans.append(
+                {
+                    "resource": json.loads(res_key),
+                    "scopeSpans": [
+                        {"scope": json.loads(scope_json), "spans": spans}
+                        for scope_json, spans in by_scope.items()
+                    ],
+                }
+            )
+        traces_by_id[trace_id] = {"resourceSpans": resource_spans}
+    return traces_by_id
+
+
+def _best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(path, traces, traces_per_payload, repeat):
+    if not os.path.exists(path):
+        write_synthetic_file(path, traces, traces_per_payload)
+    with open(path) as f:
+        payloads = [json.loads(line) for line in f]
+
+    before_s = _best_time(lambda: group_by_serializing(payloads), repeat)
+    after_s = _best_time(lambda: group_resource_spans_by_trace_id(payloads), repeat)
+    grouped = group_resource_spans_by_trace_id(payloads)
+
+    print(f"{len(payloads):,} payloads, {len(grouped):,} traces")
+    print(f"{'grouping':<10}{'s':>8}")
+    print(f"{'before':<10}{before_s:>8.2f}")
+    print(f"{'after':<10}{after_s:>8.2f}  ({before_s / after_s:.1f}x)")
+    # The interned grouping must produce the same structures
+    print(f"same result: {group_by_serializing(payloads) == grouped}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time group_resource_spans_by_trace_id on synthetic traces."
+    )
+    parser.add_argument(
+        "--path",
+        default=os.path.join(tempfile.gettempdir(), "grouping_benchmark.jsonl"),
+        help="Collector JSONL file to group (generated if missing)",
+    )
+    parser.add_argument(
+        "--traces", type=int, default=30_000, help="Traces in a generated file"
+    )
+    parser.add_argument(
+        "--traces-per-payload",
+        type=int,
+        default=4,
+        help="Traces per generated collector line",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per measurement, best is kept"
+    )
+    args = parser.parse_args()
+    main(args.path, args.traces, args.traces_per_payload, args.repeat)
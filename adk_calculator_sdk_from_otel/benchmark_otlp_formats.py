@@ -0,0 +1,112 @@
+"""Compare file size and parse throughput of collector JSON and protobuf output."""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import time
+
+from google.protobuf import json_format
+from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+
+from dbnl_otel_converter import (
+    PROTO_RECORD_LENGTH,
+    _load_payload,
+    _read_records,
+    dbnl_df_from_otel_file,
+    otel_file_format,
+)
+
+# OTLP JSON encodes ids as hex; the protobuf JSON mapping expects base64 bytes
+ID_FIELDS = ("traceId", "spanId", "parentSpanId")
+
+
+def write_proto_file(json_path, proto_path):
+    """Re-encode a collector JSONL file as length-delimited TracesData records."""
+    with open(json_path, "rb") as src, open(proto_path, "wb") as dst:
+        for line in src:
+            payload = json.loads(line)
+            for rs in payload.get("resourceSpans", []):
+                for ss in rs.get("scopeSpans", []):
+                    for span in ss.get("spans", []):
+                        _hex_ids_to_base64(span)
+                        for link in span.get("links", []):
+                            _hex_ids_to_base64(link)
+            record = json_format.ParseDict(payload, TracesData()).SerializeToString()
+            dst.write(PROTO_RECORD_LENGTH.pack(len(record)))
+            dst.write(record)
+
+
+def _hex_ids_to_base64(obj):
+    for field in ID_FIELDS:
+        if obj.get(field):
+            obj[field] = base64.b64encode(bytes.fromhex(obj[field])).decode()
+
+
+def _best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _parse(path):
+    spans = 0
+    proto = otel_file_format(path) == "proto"
+    for record, _ in _read_records(path):
+        payload = _load_payload(record, proto)
+        spans += sum(
+            len(ss.get("spans", []))
+            for rs in payload.get("resourceSpans", [])
+            for ss in rs.get("scopeSpans", [])
+        )
+    return spans
+
+
+def main(json_path, proto_path, repeat):
+    if not os.path.exists(proto_path):
+        write_proto_file(json_path, proto_path)
+
+    print(
+        f"{'format':<8}{'size MB':>10}{'gzip MB':>10}{'parse s':>10}"
+        f"{'spans/s':>12}{'convert s':>11}"
+    )
+    frames = []
+    for label, path in (("json", json_path), ("proto", proto_path)):
+        with open(path, "rb") as f:
+            data = f.read()
+        spans = _parse(path)
+        parse_s = _best_time(lambda: _parse(path), repeat)
+        convert_s = _best_time(lambda: dbnl_df_from_otel_file(path, workers=1), repeat)
+        print(
+            f"{label:<8}{len(data) / 1e6:>10.1f}{len(gzip.compress(data)) / 1e6:>10.1f}"
+            f"{parse_s:>10.2f}{spans / parse_s:>12,.0f}{convert_s:>11.2f}"
+        )
+        frames.append(dbnl_df_from_otel_file(path, workers=1))
+
+    # Both formats must load to the same dataframe
+    json_df, proto_df = frames
+    same = list(json_df.pop("traces_data")) == list(proto_df.pop("traces_data"))
+    print(f"same dataframe: {same and json_df.equals(proto_df)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare collector JSON and protobuf trace files."
+    )
+    parser.add_argument("json_path", help="Collector JSONL file to benchmark")
+    parser.add_argument(
+        "--proto-path",
+        help="Length-delimited protobuf copy (written from json_path if missing; "
+        "default: json_path with a .binpb extension)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per measurement, best is kept"
+    )
+    args = parser.parse_args()
+    proto_path = args.proto_path or os.path.splitext(args.json_path)[0] + ".binpb"
+    main(args.json_path, proto_path, args.repeat)
@@ -0,0 +1,258 @@
+import dbnl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from collections import defaultdict
+
+from dbnl_otel_converter import is_llm_call, is_tool_call, traces_data_dicts
+
+# Where a span's own time is spent; "other" is agent/framework overhead
+SPAN_CATEGORIES = ("llm", "tool", "other")
+
+SPAN_TREE_COLUMNS = [
+    "trace_id",
+    "span_id",
+    "parent_span_id",
+    "name",
+    "category",
+    "start_us",
+    "end_us",
+    "duration_us",
+    "self_us",
+    "critical_us",
+    "depth",
+    "stack",
+]
+
+# Deeper ancestor chains than this are treated as parent_span_id cycles
+MAX_SPAN_DEPTH = 256
+
+
+def span_tree(dbnl_df):
+    """
+    Flatten converted traces into one row per span with its place in the span tree.
+
+    Args:
+        dbnl_df: Output of dbnl_df_from_otel_file. The "spans" column from
+                 include_spans=True is used when present, otherwise traces_data is
+                 converted with dbnl.convert_otlp_traces_data.
+
+    Returns:
+        DataFrame with SPAN_TREE_COLUMNS, times in integer microseconds:
+            category: "llm", "tool" or "other" per is_llm_call/is_tool_call,
+                      tool first when a span matches both
+            self_us: time not covered by any child span (overlapping children
+                     are only counted once)
+            critical_us: time this span contributes to its trace's critical path
+            depth: 0 for root spans (no parent in the same trace)
+            stack: root-to-span names joined by ";", as in folded stacks
+    """
+    if "spans" in dbnl_df:
+        dbnl_spans = dbnl_df["spans"]
+    else:
+        dbnl_spans = dbnl.convert_otlp_traces_data(
+            data=pd.Series(traces_data_dicts(dbnl_df["traces_data"]))
+        )
+
+    spans = pc.list_flatten(pa.chunked_array(pa.array(dbnl_spans))).combine_chunks()
+    spans_df = pd.DataFrame(
+        {
+            "trace_id": spans.field("trace_id").to_pandas(),
+            "span_id": spans.field("span_id").to_pandas(),
+            "parent_span_id": spans.field("parent_span_id").to_pandas(),
+            "name": spans.field("name").to_pandas(),
+            "start_us": pc.cast(spans.field("start_time"), pa.int64()).to_pandas(),
+            "end_us": pc.cast(spans.field("end_time"), pa.int64()).to_pandas(),
+        }
+    )
+    spans_df["name"] = spans_df["name"].fillna("unknown")
+    spans_df["category"] = [
+        _span_category(name, attributes)
+        for name, attributes in zip(
+            spans_df["name"], spans.field("attributes").to_pylist()
+        )
+    ]
+    spans_df["duration_us"] = spans_df["end_us"] - spans_df["start_us"]
+    spans_df = spans_df.drop_duplicates(["trace_id", "span_id"], ignore_index=True)
+
+    # Vectorized join of each span to its parent; unmatched parents are roots
+    parents = spans_df[["trace_id", "span_id", "start_us", "end_us"]].rename(
+        columns={
+            "span_id": "parent_span_id",
+            "start_us": "parent_start_us",
+            "end_us": "parent_end_us",
+        }
+    )
+    children = spans_df[["trace_id", "parent_span_id", "start_us", "end_us"]].merge(
+        parents, on=["trace_id", "parent_span_id"]
+    )
+    spans_df["self_us"] = (
+        spans_df["duration_us"]
+        - _covered_us(children)
+        .reindex(
+            pd.MultiIndex.from_frame(spans_df[["trace_id", "span_id"]]), fill_value=0
+        )
+        .to_numpy()
+    )
+
+    spans_df["depth"], spans_df["stack"] = _ancestor_stacks(spans_df)
+    spans_df["critical_us"] = _critical_us(spans_df)
+    return spans_df[SPAN_TREE_COLUMNS]
+
+
+def trace_latency(span_tree_df):
+    """
+    Per-trace latency breakdown from span_tree.
+
+    Returns:
+        DataFrame indexed by trace_id with duration_ms (root span),
+        critical_path_ms, "<category>_self_ms" and "<category>_critical_ms" for
+        each of SPAN_CATEGORIES, and critical_path, the names of the spans on the
+        critical path in start order. Join it onto the converter output with
+        dbnl_df.join(trace_latency(span_tree(dbnl_df)), on="trace_id").
+    """
+    grouped = span_tree_df.groupby("trace_id", sort=True)
+    latency = pd.DataFrame(
+        {
+            "duration_ms": span_tree_df[span_tree_df["depth"] == 0]
+            .groupby("trace_id")["duration_us"]
+            .max(),
+            "critical_path_ms": grouped["critical_us"].sum(),
+        }
+    )
+    for column, prefix in (("self_us", "self"), ("critical_us", "critical")):
+        by_category = span_tree_df.pivot_table(
+            index="trace_id",
+            columns="category",
+            values=column,
+            aggfunc="sum",
+            fill_value=0,
+        ).reindex(columns=list(SPAN_CATEGORIES), fill_value=0)
+        for category in SPAN_CATEGORIES:
+            latency[f"{category}_{prefix}_ms"] = by_category[category]
+    latency = latency.fillna(0) / 1000
+
+    on_path = span_tree_df[span_tree_df["critical_us"] > 0].sort_values(
+        ["trace_id", "start_us"], kind="stable"
+    )
+    latency["critical_path"] = on_path.groupby("trace_id")["name"].agg(list)
+    return latency
+
+
+def write_folded_stacks(span_tree_df, path, value="self_us"):
+    """
+    Write span time as folded stacks ("root;child;leaf <count>" per line), the
+    input format of flamegraph.pl, inferno and speedscope.
+
+    Identical stacks are summed across all traces, so one file shows where time
+    goes over thousands of traces. value is "self_us" (a flame graph of total
+    time) or "critical_us" (only time on each trace's critical path); counts are
+    microseconds.
+    """
+    totals = span_tree_df.groupby("stack", sort=True)[value].sum()
+    with open(path, "w") as f:
+        for stack, count in totals[totals > 0].items():
+            f.write(f"{stack} {int(count)}\n")
+
+
+def _span_category(name, attributes):
+    attrs = dict(attributes or [])
+    if is_tool_call(name, attrs):
+        return "tool"
+    if is_llm_call(name, attrs):
+        return "llm"
+    return "other"
+
+
+def _covered_us(children):
+    """Length of the union of each parent's child intervals, clipped to the parent."""
+    start = children["start_us"].clip(lower=children["parent_start_us"])
+    end = children["end_us"].clip(upper=children["parent_end_us"])
+    intervals = pd.DataFrame(
+        {
+            "trace_id": children["trace_id"],
+            "span_id": children["parent_span_id"],
+            "start": start,
+            "end": end,
+        }
+    )
+    intervals = intervals[intervals["end"] > intervals["start"]].sort_values(
+        ["trace_id", "span_id", "start"], ignore_index=True
+    )
+
+    # Sorted by start, a child only adds the part past the furthest end before it
+    keys = [intervals["trace_id"], intervals["span_id"]]
+    reached = intervals["end"].groupby(keys, sort=False).cummax()
+    reached = reached.groupby(keys, sort=False).shift()
+    added = (intervals["end"] - intervals["start"].clip(lower=reached)).clip(lower=0)
+    return added.groupby(keys).sum().astype("int64")
+
+
+def _ancestor_stacks(spans_df):
+    """Depth and root-to-span name path of every span, one parent join per level."""
+    keys = pd.MultiIndex.from_frame(spans_df[["trace_id", "span_id"]])
+    name_by_key = pd.Series(spans_df["name"].str.replace(";", ":").array, index=keys)
+    parent_by_key = pd.Series(spans_df["parent_span_id"].array, index=keys)
+
+    stacks = name_by_key.to_numpy(dtype=object).copy()
+    depth = pd.Series(0, index=spans_df.index)
+    ancestor = spans_df["parent_span_id"].copy()
+    for _ in range(MAX_SPAN_DEPTH):
+        ancestor_keys = pd.MultiIndex.from_arrays([spans_df["trace_id"], ancestor])
+        ancestor_names = name_by_key.reindex(ancestor_keys).to_numpy(dtype=object)
+        found = pd.notna(ancestor_names)
+        if not found.any():
+            break
+        stacks[found] = ancestor_names[found] + ";" + stacks[found]
+        depth[found] += 1
+        ancestor = pd.Series(
+            parent_by_key.reindex(ancestor_keys).to_numpy(dtype=object),
+            index=spans_df.index,
+        ).where(found)
+    return depth, stacks
+
+
+def _critical_us(spans_df):
+    """
+    Critical path contribution of every span.
+
+    Walking back from a span's end, the child that finishes last before the
+    cursor is on the critical path; gaps between such children are the span's
+    own critical time. Each trace starts from its longest root span.
+    """
+    spans = {}  # (trace_id, span_id) -> (start, end)
+    children = defaultdict(list)  # (trace_id, span_id) -> [(end, start, span_id)]
+    roots = {}  # trace_id -> (duration, span_id)
+    rows = spans_df[
+        ["trace_id", "span_id", "parent_span_id", "start_us", "end_us", "depth"]
+    ].itertuples(index=False, name=None)
+    for trace_id, span_id, parent_span_id, start, end, depth in rows:
+        spans[trace_id, span_id] = (start, end)
+        if depth == 0:
+            roots[trace_id] = max(roots.get(trace_id, (-1, "")), (end - start, span_id))
+        else:
+            children[trace_id, parent_span_id].append((end, start, span_id))
+    for child_list in children.values():
+        child_list.sort(reverse=True)
+
+    critical = defaultdict(int)
+    for trace_id, (_, root) in roots.items():
+        start, end = spans[trace_id, root]
+        pending = [(root, start, end)]  # (span_id, window start, window end)
+        while pending:
+            span_id, window_start, cursor = pending.pop()
+            for child_end, child_start, child_id in children.get(
+                (trace_id, span_id), ()
+            ):
+                if child_start >= cursor or child_end <= window_start:
+                    continue
+                child_end = min(child_end, cursor)
+                critical[trace_id, span_id] += cursor - child_end
+                child_start = max(child_start, window_start)
+                pending.append((child_id, child_start, child_end))
+                cursor = child_start
+            critical[trace_id, span_id] += max(cursor - window_start, 0)
+
+    return [
+        critical.get(key, 0) for key in zip(spans_df["trace_id"], spans_df["span_id"])
+    ]
@@ -1,7 +1,182 @@
 import dbnl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import base64
+import bz2
+import glob
+import gzip
+import hashlib
+import io
 import json
+import math
+import mmap
+import os
+import pickle
+import re
+import sqlite3
+import struct
+import tempfile
+import zlib
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from graphlib import TopologicalSorter
+from itertools import groupby, repeat
+from operator import itemgetter
+
+# Matches span and link trace ids in collector JSON lines without decoding them
+TRACE_ID_PATTERN = re.compile(r'"traceId"\s*:\s*"([^"]*)"')
+TRACE_ID_BYTES_PATTERN = re.compile(TRACE_ID_PATTERN.pattern.encode())
+
+# Span start/end times, read by the time-window prefilter before decoding a line
+START_TIME_BYTES_PATTERN = re.compile(rb'"startTimeUnixNano"\s*:\s*"(\d+)"')
+END_TIME_BYTES_PATTERN = re.compile(rb'"endTimeUnixNano"\s*:\s*"(\d+)"')
+
+DBNL_DF_COLUMNS = ["trace_id", "input", "output", "timestamp", "traces_data"]
+
+# Per-trace metrics, matching DBNLSemConvFileExporter._write_trace
+TRACE_METRIC_DTYPES = {
+    "session_id": "string",
+    "duration_ms": "Int64",
+    "status": "string",
+    "status_message": "string",
+    "total_token_count": "int64",
+    "prompt_token_count": "int64",
+    "completion_token_count": "int64",
+    "total_cost": "float64",
+    "prompt_cost": "float64",
+    "completion_cost": "float64",
+    "tool_call_count": "int64",
+    "tool_call_error_count": "int64",
+    "tool_call_name_counts": "object",
+    "llm_call_count": "int64",
+    "llm_call_error_count": "int64",
+    "llm_call_model_counts": "object",
+}
+
+# Model pricing in USD per 1M tokens (prompt / completion), as in
+# adk_calculator_sdk_from_json/dbnl_semconv_file_exporter.py
+MODEL_PRICING = {
+    "gemini-2.5-flash": {"prompt": 0.075, "completion": 0.30},
+    "gemini-2.0-flash": {"prompt": 0.075, "completion": 0.30},
+    "gemini-1.5-pro": {"prompt": 1.25, "completion": 5.00},
+    "gemini-1.5-flash": {"prompt": 0.075, "completion": 0.30},
+    "gemini-pro": {"prompt": 0.50, "completion": 1.50},
+    "gemini-flash": {"prompt": 0.075, "completion": 0.30},
+    "gpt-4": {"prompt": 30.00, "completion": 60.00},
+    "gpt-4-turbo": {"prompt": 10.00, "completion": 30.00},
+    "gpt-3.5-turbo": {"prompt": 0.50, "completion": 1.50},
+    "claude-3-opus": {"prompt": 15.00, "completion": 75.00},
+    "claude-3-sonnet": {"prompt": 3.00, "completion": 15.00},
+    "claude-3-haiku": {"prompt": 0.25, "completion": 1.25},
+}
+
+TOTAL_TOKEN_KEYS = (
+    "gen_ai.usage.total_tokens",
+    "llm.token_count.total",
+    "token_count.total",
+)
+PROMPT_TOKEN_KEYS = (
+    "gen_ai.usage.input_tokens",
+    "llm.token_count.prompt",
+    "token_count.prompt",
+    "prompt_tokens",
+)
+COMPLETION_TOKEN_KEYS = (
+    "gen_ai.usage.output_tokens",
+    "llm.token_count.completion",
+    "token_count.completion",
+    "completion_tokens",
+)
+SESSION_ID_KEYS = (
+    "session.id",
+    "session_id",
+    "ai.session.id",
+    "app.session.id",
+    "user.session.id",
+    "gcp.vertex.agent.session_id",
+)
+TOOL_CALL_KEYS = (
+    "tool.name",
+    "gen_ai.tool.name",
+    "function.name",
+    "gen_ai.request.tool_calls",
+)
+LLM_CALL_KEYS = ("gen_ai.system", "gen_ai.request.model", "llm.model_name")
+
+# How the traces_data column holds each trace's OTLP payload
+TRACES_DATA_FORMATS = ("dict", "arrow", "lazy")
+
+# Columns stored as JSON text in the Parquet cache
+CACHE_JSON_COLUMNS = ("traces_data", "tool_call_name_counts", "llm_call_model_counts")
+
+# Long-format attribute table, one typed column per OTLP AnyValue scalar
+ATTRIBUTE_TABLE_DTYPES = {
+    "trace_id": "string",
+    "span_id": "string",
+    "key": "string",
+    "string_value": "string",
+    "int_value": "Int64",
+    "double_value": "Float64",
+    "bool_value": "boolean",
+}
+ATTRIBUTE_TABLE_COLUMNS = list(ATTRIBUTE_TABLE_DTYPES)
+
+# Parquet cache of converted files; bump CACHE_VERSION when the output changes
+CACHE_VERSION = 1
+CACHE_SAMPLE_BYTES = 1 << 16  # head/tail bytes hashed into the cache key
+CACHE_MAX_BYTES = 1 << 30
+
+# Compressed collector files, detected by magic bytes, else by extension. zstd
+# needs the optional zstandard package
+COMPRESSION_MAGIC = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\x28\xb5\x2f\xfd": "zstd",
+}
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".zst": "zstd"}
+
+# The collector's file exporter with format: proto writes each TracesData message
+# after its length as a big-endian uint32. Needs the opentelemetry-proto package
+PROTO_RECORD_LENGTH = struct.Struct(">I")
+
+# Timestamp the collector's file rotation inserts into backup file names
+ROTATION_TIMESTAMP_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}(?:\.\d+)?"
+)
+
+# Span de-duplication: exact (traceId, spanId) keys up to DEDUPE_MAX_EXACT_SPANS,
+# then a Bloom filter sized for DEDUPE_BLOOM_CAPACITY keys at this false positive
+# rate (a false positive drops a span that was not a duplicate)
+DEDUPE_MAX_EXACT_SPANS = 1_000_000
+DEDUPE_BLOOM_CAPACITY = 10_000_000  # 24 MB
+DEDUPE_BLOOM_ERROR_RATE = 1e-4
+
+# Peak memory of an in-memory conversion per byte of collector JSON (measured on
+# ADK traces, dict traces_data); memory_budget switches to a SQLite spill above it
+IN_MEMORY_BYTES_PER_FILE_BYTE = 16
+# Collector JSON per byte of length-delimited protobuf for the same spans
+JSON_BYTES_PER_PROTO_BYTE = 2.5
+
+# Leading bytes of a tailed file hashed into its checkpoint
+TAIL_HEAD_BYTES = 4096
+
+# Sidecar trace index: header, then (trace id, line offset, line length) records
+TRACE_INDEX_SUFFIX = ".tidx"
+TRACE_INDEX_MAGIC = b"OTIX"
+TRACE_INDEX_VERSION = 1
+TRACE_INDEX_HEADER = struct.Struct("<4sIQ")  # magic, version, indexed file size
+TRACE_INDEX_RECORD = struct.Struct("<16sQI")
+
+
+def _fingerprint(obj, fingerprints):
+    """Stable key for a resource/scope dict, serialized once per distinct object."""
+    entry = fingerprints.get(id(obj))
+    if entry is None:
+        # Keep a reference to obj so its id() cannot be reused while cached
+        entry = fingerprints[id(obj)] = (json.dumps(obj, sort_keys=True), obj)
+    return entry[0]
 
 
 def group_resource_spans_by_trace_id(raw_spans_series):
@@ -11,18 +186,26 @@ def group_resource_spans_by_trace_id(raw_spans_series):
 
     Returns:
         dict[trace_id] -> {"resourceSpans": [...]}
+
+    Resource and scope objects are shared by reference between traces, so
+    treat the returned structures as read-only.
     """
-    # trace_id -> ( (resource_key, scope_key) -> scopeSpanInfo )
-    grouped = defaultdict(lambda: {})
+    fingerprints = {}  # id(obj) -> (fingerprint, obj)
+    interned = {}  # fingerprint -> first object seen with that content
+
+    # trace_id -> ( (resource_key, scope_key) -> spans )
+    grouped = defaultdict(dict)
 
     for payload in raw_spans_series:
         for rs in payload.get("resourceSpans", []):
             resource = rs.get("resource", {})
-            resource_key = json.dumps(resource, sort_keys=True)
+            resource_key = _fingerprint(resource, fingerprints)
+            interned.setdefault(resource_key, resource)
 
             for ss in rs.get("scopeSpans", []):
                 scope = ss.get("scope", {})
-                scope_key = json.dumps(scope, sort_keys=True)
+                scope_key = _fingerprint(scope, fingerprints)
+                interned.setdefault(scope_key, scope)
 
                 for span in ss.get("spans", []):
                     trace_id = span.get("traceId")
@@ -34,55 +217,32 @@ def group_resource_spans_by_trace_id(raw_spans_series):
                     rs_scope_key = (resource_key, scope_key)
 
                     if rs_scope_key not in trace_bucket:
-                        trace_bucket[rs_scope_key] = {
-                            "resource": resource,
-                            "scope": scope,
-                            "spans": [],
-                        }
+                        trace_bucket[rs_scope_key] = []
 
-                    trace_bucket[rs_scope_key]["spans"].append(span)
+                    trace_bucket[rs_scope_key].append(span)
 
     # Build final OTLP-style structures
     traces_by_id = {}
 
     for trace_id, rs_scope_map in grouped.items():
-        resourceSpans = []
-
-        # rs_scope_map: (resource_key, scope_key) -> {resource, scope, spans}
+        # rs_scope_map: (resource_key, scope_key) -> spans
         # We need to group by resource, then within each, group by scope
-        by_resource = defaultdict(list)
-        for (_res_key, _scope_key), info in rs_scope_map.items():
-            by_resource[json.dumps(info["resource"], sort_keys=True)].append(info)
-
-        for _res_key, scope_infos in by_resource.items():
-            # For each distinct resource, collect its scopeSpans
-            scopeSpans = []
-            # group by scope to keep shape scope + spans[]
-            by_scope = defaultdict(list)
-            for info in scope_infos:
-                by_scope[json.dumps(info["scope"], sort_keys=True)].extend(
-                    info["spans"]
-                )
-
-            for scope_json, spans in by_scope.items():
-                scope = json.loads(scope_json)
-                scopeSpans.append(
-                    {
-                        "scope": scope,
-                        "spans": spans,
-                    }
-                )
+        by_resource = defaultdict(dict)
+        for (res_key, scope_key), spans in rs_scope_map.items():
+            by_resource[res_key][scope_key] = spans
 
-            # All scopeSpans share the same resource
-            resource = json.loads(_res_key)
-            resourceSpans.append(
+        traces_by_id[trace_id] = {
+            "resourceSpans": [
                 {
-                    "resource": resource,
-                    "scopeSpans": scopeSpans,
+                    "resource": interned[res_key],
+                    "scopeSpans": [
+                        {"scope": interned[scope_key], "spans": spans}
+                        for scope_key, spans in by_scope.items()
+                    ],
                 }
-            )
-
-        traces_by_id[trace_id] = {"resourceSpans": resourceSpans}
+                for res_key, by_scope in by_resource.items()
+            ]
+        }
 
     return traces_by_id
 
@@ -113,36 +273,1748 @@ def get_from_attrs(attrs, key):
     return None
 
 
-def dbnl_df_from_otel_file(path):
-    with open(path, "r") as f:
-        raw_spans = pd.Series([json.loads(line) for line in f])
+def attributes_table(traces_data):
+    """
+    Decode the span attributes of OTLP traces into one long-format table.
 
+    Args:
+        traces_data: Iterable of {"resourceSpans": [...]} dicts, such as the
+                     traces_data column returned by dbnl_df_from_otel_file, in
+                     either traces_data_format.
+
+    Returns:
+        DataFrame with one row per (span, attribute) and columns trace_id, span_id,
+        key, string_value, int_value, double_value, bool_value. Only the column
+        matching the attribute's OTLP value type is set; arrayValue and kvlistValue
+        attributes are kept JSON-encoded in string_value.
+    """
+    rows = []
+    for payload in traces_data_dicts(traces_data):
+        for rs in payload.get("resourceSpans", []):
+            for ss in rs.get("scopeSpans", []):
+                for span in ss.get("spans", []):
+                    trace_id = span.get("traceId")
+                    span_id = span.get("spanId")
+                    for attr in span.get("attributes", []):
+                        value = attr.get("value", {})
+                        row = [
+                            trace_id,
+                            span_id,
+                            attr.get("key"),
+                            None,
+                            None,
+                            None,
+                            None,
+                        ]
+                        if "stringValue" in value:
+                            row[3] = value["stringValue"]
+                        elif "intValue" in value:
+                            # OTLP JSON encodes 64-bit ints as strings
+                            row[4] = int(value["intValue"])
+                        elif "doubleValue" in value:
+                            row[5] = float(value["doubleValue"])
+                        elif "boolValue" in value:
+                            row[6] = value["boolValue"]
+                        elif value:
+                            row[3] = json.dumps(value)
+                        rows.append(row)
+
+    return pd.DataFrame(rows, columns=ATTRIBUTE_TABLE_COLUMNS).astype(
+        ATTRIBUTE_TABLE_DTYPES
+    )
+
+
+def _dbnl_df_from_raw_spans(
+    raw_spans,
+    line_refs=None,
+    include_spans=False,
+    include_metrics=False,
+    traces_data_format="dict",
+    dedupe_spans=True,
+):
     dbnl_spans = dbnl.convert_otlp_traces_data(data=raw_spans)
     spans_df = pd.DataFrame(dbnl_spans.explode().tolist())
+    # Sort once so that idxmin/idxmax ties resolve to the enclosing (outer) span,
+    # with span_id as a final tie-break independent of input order
+    spans_df = spans_df.sort_values(
+        ["start_time", "end_time", "span_id"],
+        ascending=[True, False, True],
+        kind="stable",
+        ignore_index=True,
+    )
     grouped_traces = spans_df.groupby("trace_id", dropna=False)
 
     # earliest start_time per trace
     timestamps = grouped_traces["start_time"].min().rename("timestamp")
 
-    # input: from FIRST span's attributes
-    inputs = grouped_traces.apply(
-        lambda g: get_from_attrs(
-            g.sort_values("start_time").iloc[0]["attributes"], "input.value"
-        ),
-        include_groups=False,
-    ).rename("input")
+    # inputs/outputs that are all missing would otherwise infer object dtype,
+    # so chunked conversions would not concatenate to the one-pass result
+    text_dtype = spans_df["trace_id"].dtype
 
-    # output: from LAST span's attributes
-    outputs = grouped_traces.apply(
-        lambda g: get_from_attrs(
-            g.sort_values("end_time").iloc[-1]["attributes"], "output.value"
-        ),
-        include_groups=False,
-    ).rename("output")
+    # input: from FIRST span's attributes, decoding only the selected rows
+    first_span_rows = grouped_traces["start_time"].idxmin()
+    inputs = pd.Series(
+        [
+            get_from_attrs(attrs, "input.value")
+            for attrs in spans_df.loc[first_span_rows, "attributes"]
+        ],
+        index=first_span_rows.index,
+        name="input",
+        dtype=text_dtype,
+    )
 
-    traces_by_id = group_resource_spans_by_trace_id(raw_spans)
+    # output: from LAST span's attributes
+    last_span_rows = grouped_traces["end_time"].idxmax()
+    outputs = pd.Series(
+        [
+            get_from_attrs(attrs, "output.value")
+            for attrs in spans_df.loc[last_span_rows, "attributes"]
+        ],
+        index=last_span_rows.index,
+        name="output",
+        dtype=text_dtype,
+    )
 
     dbnl_df = pd.concat([inputs, outputs, timestamps], axis=1).reset_index()
-    dbnl_df["traces_data"] = dbnl_df["trace_id"].map(traces_by_id)
+    if traces_data_format == "lazy":
+        # line_refs[i] holds the (path, offset, length) lines raw_spans[i] came from
+        lines_by_trace = defaultdict(dict)  # trace_id -> ordered set of lines
+        for payload, lines in zip(raw_spans, line_refs):
+            for trace_id in _span_trace_ids(payload):
+                lines_by_trace[trace_id].update(dict.fromkeys(lines))
+        dbnl_df["traces_data"] = [
+            TraceDataRef(trace_id, list(lines_by_trace[trace_id]), dedupe_spans)
+            for trace_id in dbnl_df["trace_id"]
+        ]
+    elif traces_data_format == "arrow":
+        traces_by_id = group_resource_spans_by_trace_id(raw_spans)
+        dbnl_df["traces_data"] = _arrow_traces_data(
+            [traces_by_id[trace_id] for trace_id in dbnl_df["trace_id"]]
+        )
+    else:
+        traces_by_id = group_resource_spans_by_trace_id(raw_spans)
+        dbnl_df["traces_data"] = dbnl_df["trace_id"].map(traces_by_id)
+
+    if include_metrics:
+        dbnl_df = dbnl_df.join(_trace_metrics(spans_df), on="trace_id")
+
+    if include_spans:
+        # Reuse this conversion instead of running convert_otlp_traces_data again
+        span_trace_ids = dbnl_spans.list[0].struct.field("trace_id")
+        dbnl_df["spans"] = pd.Series(dbnl_spans.array, index=span_trace_ids.array)[
+            dbnl_df["trace_id"]
+        ].array
 
     return dbnl_df
+
+
+def _span_keys(payloads):
+    return [
+        (span.get("traceId"), span.get("spanId"))
+        for payload in payloads
+        for rs in payload.get("resourceSpans", [])
+        for ss in rs.get("scopeSpans", [])
+        for span in ss.get("spans", [])
+    ]
+
+
+def _span_trace_ids(payload):
+    return {
+        span.get("traceId")
+        for rs in payload.get("resourceSpans", [])
+        for ss in rs.get("scopeSpans", [])
+        for span in ss.get("spans", [])
+    }
+
+
+class TraceDataRef:
+    """
+    Lazy traces_data value: where one trace's spans are in the collector files.
+
+    lines lists the (path, offset, length) of every line holding spans of trace_id,
+    in the order they were read. Nothing is decoded until materialize() is called;
+    to materialize a whole column use traces_data_dicts, which reads each file once.
+    dedupe_spans is the load's setting: whether repeated spans are dropped again
+    when the lines are read back.
+    """
+
+    __slots__ = ("trace_id", "lines", "dedupe_spans")
+
+    def __init__(self, trace_id, lines, dedupe_spans=True):
+        self.trace_id = trace_id
+        self.lines = lines
+        self.dedupe_spans = dedupe_spans
+
+    def materialize(self):
+        """The trace's {"resourceSpans": [...]} dict, read from its lines."""
+        return _materialize_trace_data_refs([self])[0]
+
+    def __eq__(self, other):
+        if not isinstance(other, TraceDataRef):
+            return NotImplemented
+        return (self.trace_id, self.lines, self.dedupe_spans) == (
+            other.trace_id,
+            other.lines,
+            other.dedupe_spans,
+        )
+
+    def __repr__(self):
+        return f"TraceDataRef({self.trace_id!r}, {len(self.lines)} lines)"
+
+
+class SpanDeduplicator:
+    """
+    Drops spans whose (traceId, spanId) was already seen, e.g. from exporter
+    retries or overlapping collector files, keeping the first copy.
+
+    Keys are kept exactly in a set until it holds max_exact of them, then moved
+    into a Bloom filter so memory stays bounded on any input size. dropped counts
+    the spans removed so far.
+    """
+
+    def __init__(self, max_exact=DEDUPE_MAX_EXACT_SPANS):
+        self.max_exact = max_exact
+        self.dropped = 0
+        self._seen = set()
+        self._bloom = None
+
+    def filter(self, payload):
+        """The payload without already seen spans; scopes left empty are removed."""
+        resource_spans = payload.get("resourceSpans", [])
+        keep = [
+            [
+                [self._first_seen(span) for span in ss.get("spans", [])]
+                for ss in rs.get("scopeSpans", [])
+            ]
+            for rs in resource_spans
+        ]
+        if all(all(all(ks) for ks in kr) for kr in keep):
+            return payload
+
+        filtered = []
+        for rs, keep_rs in zip(resource_spans, keep):
+            scope_spans = []
+            for ss, keep_ss in zip(rs.get("scopeSpans", []), keep_rs):
+                spans = [span for span, k in zip(ss.get("spans", []), keep_ss) if k]
+                self.dropped += len(keep_ss) - len(spans)
+                if spans:
+                    scope_spans.append({**ss, "spans": spans})
+            if scope_spans:
+                filtered.append({**rs, "scopeSpans": scope_spans})
+        return {**payload, "resourceSpans": filtered}
+
+    def add_keys(self, keys):
+        """Treat these (traceId, spanId) pairs as already seen."""
+        for key in keys:
+            self._first_seen_key(tuple(key))
+
+    def _first_seen(self, span):
+        return self._first_seen_key((span.get("traceId"), span.get("spanId")))
+
+    def _first_seen_key(self, key):
+        if self._bloom is not None:
+            return not self._bloom.add(f"{key[0]}/{key[1]}".encode())
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        if len(self._seen) > self.max_exact:
+            self._bloom = _BloomFilter(DEDUPE_BLOOM_CAPACITY, DEDUPE_BLOOM_ERROR_RATE)
+            for trace_id, span_id in self._seen:
+                self._bloom.add(f"{trace_id}/{span_id}".encode())
+            self._seen = set()
+        return True
+
+
+class _BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        """Add key; True if it may have been added before."""
+        # Double hashing over one 128-bit digest
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        present = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.size
+            mask = 1 << (bit & 7)
+            if not self.bits[bit >> 3] & mask:
+                present = False
+                self.bits[bit >> 3] |= mask
+        return present
+
+
+def _materialize_trace_data_refs(refs):
+    # Read every referenced line once, per file in offset order
+    lines_by_path = defaultdict(set)
+    path_order = TopologicalSorter()  # files in the order they were loaded
+    for ref in refs:
+        ref_paths = list(dict.fromkeys(path for path, _, _ in ref.lines))
+        path_order.add(ref_paths[0])
+        for before, after in zip(ref_paths, ref_paths[1:]):
+            path_order.add(after, before)
+        for path, offset, length in ref.lines:
+            lines_by_path[path].add((offset, length))
+
+    payloads = []
+    for path in path_order.static_order():
+        lines = lines_by_path[path]
+        proto = otel_file_format(path) == "proto"
+        # Offsets ascend, so compressed files are decompressed in one forward pass
+        with _open_otel_file(path) as f:
+            for offset, length in sorted(lines):
+                f.seek(offset)
+                payloads.append(_load_payload(f.read(length), proto))
+
+    # Lines are re-read whole, so drop duplicate spans again if the load did
+    traces_by_id = {}
+    for dedupe_spans in {ref.dedupe_spans for ref in refs}:
+        source = map(SpanDeduplicator().filter, payloads) if dedupe_spans else payloads
+        traces_by_id[dedupe_spans] = group_resource_spans_by_trace_id(source)
+    return [traces_by_id[ref.dedupe_spans][ref.trace_id] for ref in refs]
+
+
+def _read_records(path, start=0, end=None):
+    """
+    Raw records of a file from start to end, with their (path, offset, length).
+
+    Records are JSON lines, or the TracesData messages of a protobuf file (see
+    PROTO_RECORD_LENGTH); decode either with _load_payload, passing the file's
+    format. Blank JSON lines are skipped. Offsets of compressed files are
+    positions in the decompressed stream.
+    """
+    path = os.path.abspath(path)
+    proto = otel_file_format(path) == "proto"
+    with _open_otel_file(path) as f:
+        f.seek(start)
+        offset = start
+        while end is None or offset < end:
+            if proto:
+                prefix = f.read(PROTO_RECORD_LENGTH.size)
+                if len(prefix) < PROTO_RECORD_LENGTH.size:
+                    break
+                (length,) = PROTO_RECORD_LENGTH.unpack(prefix)
+                offset += len(prefix)
+                record = f.read(length)
+            else:
+                record = f.readline()
+                if record and not record.strip():
+                    offset += len(record)
+                    continue
+            if not record:
+                break
+            yield record, (path, offset, len(record))
+            offset += len(record)
+
+
+def _load_payload(record, proto):
+    """Decode a JSON line or protobuf TracesData record into the OTLP JSON dict."""
+    if proto:
+        return _traces_data_from_proto(record)
+    return json.loads(record)
+
+
+def _traces_data_from_proto(record):
+    try:
+        from opentelemetry.proto.trace.v1.trace_pb2 import TracesData
+    except ImportError as e:
+        raise ImportError(
+            "Reading protobuf trace files requires the opentelemetry-proto package"
+        ) from e
+
+    resource_spans = []
+    for rs in TracesData.FromString(record).resource_spans:
+        scope_spans = []
+        for ss in rs.scope_spans:
+            scope_dict = {"scope": _proto_scope(ss.scope)}
+            scope_dict["spans"] = [_proto_span(span) for span in ss.spans]
+            if ss.schema_url:
+                scope_dict["schemaUrl"] = ss.schema_url
+            scope_spans.append(scope_dict)
+        rs_dict = {
+            "resource": _proto_attributed(rs.resource, {}),
+            "scopeSpans": scope_spans,
+        }
+        if rs.schema_url:
+            rs_dict["schemaUrl"] = rs.schema_url
+        resource_spans.append(rs_dict)
+    return {"resourceSpans": resource_spans}
+
+
+def _proto_span(span):
+    # Field names and encodings of the collector's JSON: hex ids, integer enums,
+    # 64-bit integers as strings, most zero values left out
+    span_dict = {"traceId": span.trace_id.hex(), "spanId": span.span_id.hex()}
+    if span.trace_state:
+        span_dict["traceState"] = span.trace_state
+    span_dict["parentSpanId"] = span.parent_span_id.hex()  # "" on roots, as in JSON
+    if span.flags:
+        span_dict["flags"] = span.flags
+    span_dict["name"] = span.name
+    span_dict["kind"] = span.kind
+    span_dict["startTimeUnixNano"] = str(span.start_time_unix_nano)
+    span_dict["endTimeUnixNano"] = str(span.end_time_unix_nano)
+    _proto_attributed(span, span_dict)
+    if span.events:
+        span_dict["events"] = [
+            _proto_attributed(
+                event,
+                {"timeUnixNano": str(event.time_unix_nano), "name": event.name},
+            )
+            for event in span.events
+        ]
+    if span.dropped_events_count:
+        span_dict["droppedEventsCount"] = span.dropped_events_count
+    if span.links:
+        span_dict["links"] = [_proto_link(link) for link in span.links]
+    if span.dropped_links_count:
+        span_dict["droppedLinksCount"] = span.dropped_links_count
+    status = {}
+    if span.status.message:
+        status["message"] = span.status.message
+    if span.status.code:
+        status["code"] = span.status.code
+    span_dict["status"] = status
+    return span_dict
+
+
+def _proto_scope(scope):
+    scope_dict = {"name": scope.name}
+    if scope.version:
+        scope_dict["version"] = scope.version
+    return _proto_attributed(scope, scope_dict)
+
+
+def _proto_link(link):
+    link_dict = {"traceId": link.trace_id.hex(), "spanId": link.span_id.hex()}
+    if link.trace_state:
+        link_dict["traceState"] = link.trace_state
+    if link.flags:
+        link_dict["flags"] = link.flags
+    return _proto_attributed(link, link_dict)
+
+
+def _proto_attributed(message, into):
+    """Add a message's attributes and droppedAttributesCount to a dict."""
+    if message.attributes:
+        into["attributes"] = [_proto_key_value(kv) for kv in message.attributes]
+    if message.dropped_attributes_count:
+        into["droppedAttributesCount"] = message.dropped_attributes_count
+    return into
+
+
+def _proto_key_value(kv):
+    value = kv.value
+    if value.WhichOneof("value") == "string_value":
+        # Most attributes; skips a call per value
+        return {"key": kv.key, "value": {"stringValue": value.string_value}}
+    return {"key": kv.key, "value": _proto_any_value(value)}
+
+
+def _proto_any_value(value):
+    kind = value.WhichOneof("value")
+    if kind == "string_value":
+        return {"stringValue": value.string_value}
+    if kind == "int_value":
+        return {"intValue": str(value.int_value)}
+    if kind == "double_value":
+        return {"doubleValue": value.double_value}
+    if kind == "bool_value":
+        return {"boolValue": value.bool_value}
+    if kind == "array_value":
+        return {
+            "arrayValue": {
+                "values": [_proto_any_value(v) for v in value.array_value.values]
+            }
+        }
+    if kind == "kvlist_value":
+        return {
+            "kvlistValue": {
+                "values": [_proto_key_value(kv) for kv in value.kvlist_value.values]
+            }
+        }
+    if kind == "bytes_value":
+        return {"bytesValue": base64.b64encode(value.bytes_value).decode()}
+    return {}
+
+
+def _record_trace_ids(record, proto):
+    """Trace ids a record holds spans or links of, skipping full JSON decoding."""
+    if not proto:
+        return [
+            trace_id.decode() for trace_id in TRACE_ID_BYTES_PATTERN.findall(record)
+        ]
+    return [
+        span["traceId"]
+        for rs in _traces_data_from_proto(record)["resourceSpans"]
+        for ss in rs["scopeSpans"]
+        for span in ss["spans"]
+    ]
+
+
+def otel_file_format(path):
+    """
+    "json" for collector JSON lines, "proto" for length-delimited protobuf.
+
+    Sniffed from the first decompressed byte after any leading whitespace, so the
+    file name does not matter.
+    """
+    with _open_otel_file(path) as f:
+        while True:
+            chunk = f.read(4096)
+            head = chunk.lstrip()[:1]
+            if head or not chunk:
+                break
+    # Collector JSON lines are objects; a proto file starts with a record length
+    return "json" if head in (b"", b"{") else "proto"
+
+
+def otel_file_compression(path):
+    """ "gzip", "bz2" or "zstd" for a compressed collector file, else None."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    if not head:
+        # Nothing to sniff in an empty file
+        return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+    return None
+
+
+def _open_otel_file(path):
+    """Binary, line-iterable reader of a plain or compressed collector file."""
+    compression = otel_file_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "bz2":
+        return bz2.open(path, "rb")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                f"Reading zstd-compressed {path!r} requires the zstandard package"
+            ) from e
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        )
+    return open(path, "rb")
+
+
+def _arrow_traces_data(payloads):
+    # The struct type is the union of the fields seen in any payload; fields a
+    # payload does not have come back as None (see traces_data_dict)
+    return pd.arrays.ArrowExtensionArray(pa.array(payloads))
+
+
+def traces_data_dict(value):
+    """
+    Python dict for one traces_data value, whatever format the column is in.
+
+    Arrow-backed traces_data (traces_data_format="arrow") returns struct rows with
+    every field of the column's type, so the fields this trace does not have are
+    dropped again to give back its original OTLP JSON structure. A lazy
+    TraceDataRef (traces_data_format="lazy") is read from the file.
+    """
+    if isinstance(value, TraceDataRef):
+        return value.materialize()
+    if isinstance(value, dict):
+        return {k: traces_data_dict(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [traces_data_dict(v) for v in value]
+    return value
+
+
+def traces_data_dicts(traces_data):
+    """
+    List of Python dicts for a whole traces_data column, in any format.
+
+    Lazy references are materialized in bulk, reading each file sequentially and
+    decoding every referenced line once. Assign the result back to the column
+    before dbnl.log.
+    """
+    if isinstance(getattr(traces_data, "dtype", None), pd.ArrowDtype):
+        return [traces_data_dict(v) for v in pa.array(traces_data).to_pylist()]
+    values = list(traces_data)
+    refs = [v for v in values if isinstance(v, TraceDataRef)]
+    if not refs:
+        return values
+    materialized = iter(_materialize_trace_data_refs(refs))
+    return [next(materialized) if isinstance(v, TraceDataRef) else v for v in values]
+
+
+def _trace_metrics(spans_df):
+    """Per-trace metric columns from converted spans, in one pass over the spans."""
+    span_metrics = pd.DataFrame(
+        [
+            _span_metrics(name, attributes, status)
+            for name, attributes, status in zip(
+                spans_df["name"], spans_df["attributes"], spans_df["status"]
+            )
+        ],
+        columns=[
+            "total_token_count",
+            "prompt_token_count",
+            "completion_token_count",
+            "prompt_cost",
+            "completion_cost",
+            "tool_call_count",
+            "tool_call_error_count",
+            "tool_name",
+            "llm_call_count",
+            "llm_call_error_count",
+            "model_name",
+            "error_message",
+            "session_id",
+        ],
+    )
+    span_metrics["trace_id"] = spans_df["trace_id"]
+    span_metrics["is_root"] = is_root = spans_df["parent_span_id"].isna()
+    grouped = span_metrics.groupby("trace_id", dropna=False, sort=True)
+
+    metrics = grouped[
+        [
+            "total_token_count",
+            "prompt_token_count",
+            "completion_token_count",
+            "prompt_cost",
+            "completion_cost",
+            "tool_call_count",
+            "tool_call_error_count",
+            "llm_call_count",
+            "llm_call_error_count",
+        ]
+    ].sum()
+    metrics["total_cost"] = metrics["prompt_cost"] + metrics["completion_cost"]
+
+    # Exported spans have ended, so a trace is OK unless one of its spans failed
+    errors = span_metrics.dropna(subset=["error_message"])
+    error_messages = errors.groupby("trace_id")["error_message"].agg("; ".join)
+    metrics["status_message"] = error_messages.reindex(metrics.index, fill_value="")
+    metrics["status"] = "OK"
+    metrics.loc[error_messages.index, "status"] = "ERROR"
+
+    metrics["tool_call_name_counts"] = _counts_by_trace(
+        span_metrics, "tool_name", metrics.index
+    )
+    metrics["llm_call_model_counts"] = _counts_by_trace(
+        span_metrics, "model_name", metrics.index
+    )
+
+    # The root span sets duration_ms, and session_id unless only a child has one
+    roots = spans_df[is_root].drop_duplicates("trace_id").set_index("trace_id")
+    metrics["duration_ms"] = (roots["end_time"] - roots["start_time"]) // pd.Timedelta(
+        milliseconds=1
+    )
+    sessions = span_metrics.dropna(subset=["session_id"])
+    root_sessions = (
+        sessions[sessions["is_root"]].groupby("trace_id")["session_id"].first()
+    )
+    sessions = root_sessions.combine_first(
+        sessions.groupby("trace_id")["session_id"].first()
+    )
+    metrics["session_id"] = sessions[sessions.index.isin(roots.index)]
+    metrics["session_id"] = metrics["session_id"].fillna("")
+
+    return metrics[list(TRACE_METRIC_DTYPES)].astype(TRACE_METRIC_DTYPES)
+
+
+def _span_metrics(name, attributes, status):
+    attrs = dict(attributes or [])
+    is_error = (status or {}).get("code") == "ERROR"
+
+    total_tokens = _first_int(attrs, TOTAL_TOKEN_KEYS)
+    prompt_tokens = _first_int(attrs, PROMPT_TOKEN_KEYS)
+    completion_tokens = _first_int(attrs, COMPLETION_TOKEN_KEYS)
+    if total_tokens == 0:
+        total_tokens = _first_int(attrs, PROMPT_TOKEN_KEYS[:3]) + _first_int(
+            attrs, COMPLETION_TOKEN_KEYS[:3]
+        )
+
+    tool_call = is_tool_call(name, attrs)
+    tool_name = None
+    if tool_call:
+        tool_name = (
+            _attr_value(attrs, "gen_ai.tool.name")
+            or _attr_value(attrs, "tool.name")
+            or _attr_value(attrs, "function.name")
+            or name
+            or "unknown"
+        )
+
+    llm_call = is_llm_call(name, attrs)
+    model_name = None
+    prompt_cost = completion_cost = 0.0
+    if llm_call:
+        model_name = (
+            _attr_value(attrs, "gen_ai.request.model")
+            or _attr_value(attrs, "gen_ai.response.model")
+            or _attr_value(attrs, "llm.model_name")
+            or _attr_value(attrs, "gen_ai.system")
+        )
+        pricing = _model_pricing(model_name)
+        if pricing:
+            prompt_cost = prompt_tokens / 1_000_000 * pricing["prompt"]
+            completion_cost = completion_tokens / 1_000_000 * pricing["completion"]
+
+    error_message = None
+    if is_error:
+        message = status.get("message")
+        error_message = f"{name}: {message}" if message else f"{name} failed"
+
+    session_id = next(
+        (str(v) for v in map(partial(_attr_value, attrs), SESSION_ID_KEYS) if v),
+        None,
+    )
+
+    return (
+        total_tokens,
+        prompt_tokens,
+        completion_tokens,
+        prompt_cost,
+        completion_cost,
+        int(tool_call),
+        int(tool_call and is_error),
+        tool_name,
+        int(llm_call),
+        int(llm_call and is_error),
+        model_name,
+        error_message,
+        session_id,
+    )
+
+
+def _attr_value(attrs, key):
+    """Decode one JSON-encoded DBNL span attribute value, leaving the rest as is."""
+    value = attrs.get(key)
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def is_tool_call(name, attrs):
+    """Whether a span is a tool call, given its name and DBNL attribute dict.
+
+    A span that is both a tool call and an LLM call counts as a tool call
+    wherever a single category is needed.
+    """
+    return (
+        _attr_value(attrs, "openinference.span.kind") == "TOOL"
+        or _attr_value(attrs, "gen_ai.operation.name") == "execute_tool"
+        or any(key in attrs for key in TOOL_CALL_KEYS)
+        or "tool_call" in (name or "").lower()
+    )
+
+
+def is_llm_call(name, attrs):
+    """Whether a span is an LLM call, given its name and DBNL attribute dict."""
+    return (
+        _attr_value(attrs, "openinference.span.kind") == "LLM"
+        or any(key in attrs for key in LLM_CALL_KEYS)
+        or "llm" in (name or "").lower()
+    )
+
+
+def _first_int(attrs, keys):
+    for key in keys:
+        if key in attrs:
+            try:
+                return int(float(_attr_value(attrs, key)))
+            except (ValueError, TypeError):
+                continue
+    return 0
+
+
+def _model_pricing(model_name):
+    """Pricing for a model name, exact match first, then by containment."""
+    if not model_name or not isinstance(model_name, str):
+        return None
+    model_name_lower = model_name.lower()
+    if model_name_lower in MODEL_PRICING:
+        return MODEL_PRICING[model_name_lower]
+    for pricing_key, pricing in MODEL_PRICING.items():
+        if pricing_key in model_name_lower or model_name_lower in pricing_key:
+            return pricing
+    return None
+
+
+def _counts_by_trace(span_metrics, column, trace_ids):
+    """{value: count} per trace for a per-span column, {} where it is always null."""
+    counts = defaultdict(dict)
+    values = span_metrics.dropna(subset=[column])
+    for trace_id, value in zip(values["trace_id"], values[column]):
+        counts[trace_id][value] = counts[trace_id].get(value, 0) + 1
+    return pd.Series([counts.get(t, {}) for t in trace_ids], index=trace_ids)
+
+
+def dbnl_df_from_otel_file(
+    path,
+    workers=None,
+    cache_dir=None,
+    cache_max_bytes=CACHE_MAX_BYTES,
+    include_spans=False,
+    include_metrics=False,
+    traces_data_format="dict",
+    start=None,
+    end=None,
+    memory_budget=None,
+    dedupe_spans=True,
+    dedupe_max_exact=DEDUPE_MAX_EXACT_SPANS,
+):
+    """
+    Load OTEL traces from a JSONL file and convert to DBNL dataframe.
+
+    Args:
+        path: Path to the JSONL file containing OTEL traces, or a directory or glob
+              of rotated collector files (see list_otel_files). Traces whose spans
+              cross a rotation boundary come out as a single trace. Files may be
+              gzip, bz2 or zstd compressed and are decompressed while streaming,
+              and may hold length-delimited protobuf (format: proto in the
+              collector's file exporter) instead of JSON lines.
+        workers: Number of processes to convert with (default: 1 for a single file,
+                 one per file up to the CPU count for several). With more than
+                 one, the files are split into newline-aligned byte ranges and traces
+                 are hash-partitioned by trace_id across a process pool. The result
+                 is identical to the serial conversion. Compressed files are not
+                 split; each is decompressed by its own process.
+        cache_dir: Optional directory to cache the converted dataframe in as Parquet.
+                   Entries are keyed by each file's path, size, mtime and a hash of
+                   its head and tail, so unchanged files are loaded from the cache.
+        cache_max_bytes: Total size the cache directory is trimmed to after each
+                         write, evicting the least recently used entries first.
+        include_spans: Also return the DBNL spans that were converted internally, as
+                       a "spans" column in the format of convert_otlp_traces_data,
+                       so enrichment does not need to convert traces_data again.
+                       Pop it before dbnl.log so spans are not sent twice.
+        include_metrics: Also compute the per-trace metrics DBNLSemConvFileExporter
+                         writes (duration_ms, status, token counts, costs, tool and
+                         LLM call counts, ...) in the same pass over the converted
+                         spans, as typed columns (see TRACE_METRIC_DTYPES).
+        traces_data_format: "dict" for one nested Python dict per trace, "arrow"
+                            for a pd.ArrowDtype struct column built from the grouped
+                            spans, which is far smaller and faster to pickle, or
+                            "lazy" for TraceDataRef references to the lines each
+                            trace was read from, decoded only when materialized.
+                            Use traces_data_dict/traces_data_dicts to get Python
+                            dicts back from any of them.
+        start, end: Optional time window [start, end), as anything pd.Timestamp
+                    accepts (naive values are UTC). Only traces with a span
+                    overlapping the window are returned, always with all of their
+                    spans. Lines are checked on their raw span times first, so
+                    lines outside the window are never decoded; workers is not
+                    used in this mode.
+        memory_budget: Optional memory budget in bytes. If converting the files in
+                       memory would need more (about IN_MEMORY_BYTES_PER_FILE_BYTE
+                       per byte of JSON, protobuf counted as the JSON it
+                       decodes to), spans are streamed into a temporary
+                       SQLite database indexed by trace_id and converted in chunks
+                       of whole traces that fit the budget; workers is not used in
+                       this mode. Compressed files always take this path, as their
+                       decompressed size is not known up front. The returned
+                       dataframe itself still has to fit, so combine it with
+                       traces_data_format="arrow" or "lazy".
+        dedupe_spans: Drop repeated (traceId, spanId) spans while streaming, such
+                      as exporter retries or files loaded twice, keeping the
+                      first copy. The number dropped is reported in
+                      dbnl_df.attrs["duplicate_spans_dropped"].
+        dedupe_max_exact: Span keys tracked exactly before switching to a Bloom
+                          filter (see SpanDeduplicator). With workers, this
+                          applies per partition.
+    """
+    paths = list_otel_files(path)
+    options = _convert_options(
+        include_spans, include_metrics, traces_data_format, dedupe_spans
+    )
+    start_ns, end_ns = _unix_nano(start), _unix_nano(end)
+    if workers is None:
+        workers = min(len(paths), os.cpu_count() or 1)
+
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir,
+            _otel_file_cache_key(paths, sorted(options.items()), start_ns, end_ns)
+            + ".parquet",
+        )
+        if os.path.exists(cache_path):
+            # Refresh mtime so eviction treats this entry as recently used
+            os.utime(cache_path)
+            return _read_cached_df(cache_path, traces_data_format, dedupe_spans)
+
+    dedupe = SpanDeduplicator(dedupe_max_exact) if dedupe_spans else None
+    if start_ns is not None or end_ns is not None:
+        dbnl_df = _dbnl_df_from_otel_files_windowed(
+            paths, start_ns, end_ns, options, dedupe
+        )
+    elif memory_budget is not None and _in_memory_bytes(paths) > memory_budget:
+        dbnl_df = _dbnl_df_from_otel_files_spilled(
+            paths, memory_budget, options, dedupe
+        )
+    elif workers > 1:
+        dbnl_df, dropped = _dbnl_df_from_otel_files_parallel(
+            paths, workers, options, dedupe_spans and dedupe_max_exact
+        )
+        if dedupe is not None:
+            dedupe.dropped = dropped
+    else:
+        raw_spans, line_refs = [], []
+        for segment_path in paths:
+            proto = otel_file_format(segment_path) == "proto"
+            for line, line_ref in _read_records(segment_path):
+                payload = _dedupe_payload(dedupe, _load_payload(line, proto))
+                if payload["resourceSpans"]:
+                    raw_spans.append(payload)
+                    line_refs.append((line_ref,))
+        dbnl_df = _dbnl_df_from_raw_spans(pd.Series(raw_spans), line_refs, **options)
+    dbnl_df.attrs["duplicate_spans_dropped"] = dedupe.dropped if dedupe else 0
+
+    if cache_dir is not None:
+        _write_cached_df(
+            dbnl_df, cache_dir, cache_path, cache_max_bytes, traces_data_format
+        )
+
+    return dbnl_df
+
+
+def _dedupe_payload(dedupe, payload):
+    return payload if dedupe is None else dedupe.filter(payload)
+
+
+def _convert_options(
+    include_spans,
+    include_metrics,
+    traces_data_format,
+    dedupe_spans=True,
+    formats=TRACES_DATA_FORMATS,
+):
+    if traces_data_format not in formats:
+        raise ValueError(
+            f"traces_data_format must be one of {formats}, got {traces_data_format!r}"
+        )
+    return {
+        "include_spans": include_spans,
+        "include_metrics": include_metrics,
+        "traces_data_format": traces_data_format,
+        "dedupe_spans": dedupe_spans,
+    }
+
+
+def _empty_dbnl_df(include_spans=False, include_metrics=False, **_):
+    columns = DBNL_DF_COLUMNS + ["spans"] * include_spans
+    if include_metrics:
+        columns += list(TRACE_METRIC_DTYPES)
+    return pd.DataFrame(columns=columns)
+
+
+def _unix_nano(value):
+    if value is None:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return timestamp.value
+
+
+def _dbnl_df_from_otel_files_windowed(paths, start_ns, end_ns, options, dedupe=None):
+    # Pass 1: trace ids on lines whose raw span times may overlap the window
+    window_trace_ids = set()
+    for segment_path in paths:
+        proto = otel_file_format(segment_path) == "proto"
+        for line, _ in _read_records(segment_path):
+            if _line_may_overlap_window(line, proto, start_ns, end_ns):
+                window_trace_ids.update(_record_trace_ids(line, proto))
+
+    # Pass 2: decode every line holding spans of those traces so they stay whole
+    payloads_by_trace = defaultdict(list)  # trace_id -> (payload, line refs)
+    for segment_path in paths:
+        proto = otel_file_format(segment_path) == "proto"
+        for line, line_ref in _read_records(segment_path):
+            if window_trace_ids.isdisjoint(_record_trace_ids(line, proto)):
+                continue
+            payload = _dedupe_payload(dedupe, _load_payload(line, proto))
+            payload_by_trace = group_resource_spans_by_trace_id([payload])
+            for trace_id, trace_payload in payload_by_trace.items():
+                payloads_by_trace[trace_id].append((trace_payload, (line_ref,)))
+
+    # Lines can also carry other traces, so check each trace's own spans
+    ready = [
+        item
+        for items in payloads_by_trace.values()
+        if any(_overlaps_window(p, start_ns, end_ns) for p, _ in items)
+        for item in items
+    ]
+    if not ready:
+        return _empty_dbnl_df(**options)
+    payloads, line_refs = zip(*ready)
+    return _dbnl_df_from_raw_spans(pd.Series(list(payloads)), line_refs, **options)
+
+
+def _line_may_overlap_window(line, proto, start_ns, end_ns):
+    """Check a line's earliest start and latest end without decoding it."""
+    if proto:
+        return _overlaps_window(_load_payload(line, proto), start_ns, end_ns)
+    if end_ns is not None:
+        starts = START_TIME_BYTES_PATTERN.findall(line)
+        if starts and min(map(int, starts)) >= end_ns:
+            return False
+    if start_ns is not None:
+        ends = END_TIME_BYTES_PATTERN.findall(line)
+        if ends and max(map(int, ends)) < start_ns:
+            return False
+    return True
+
+
+def _overlaps_window(payload, start_ns, end_ns):
+    return any(
+        (end_ns is None or int(span["startTimeUnixNano"]) < end_ns)
+        and (start_ns is None or int(span["endTimeUnixNano"]) >= start_ns)
+        for rs in payload.get("resourceSpans", [])
+        for ss in rs.get("scopeSpans", [])
+        for span in ss.get("spans", [])
+    )
+
+
+def _in_memory_bytes(paths):
+    """Estimated peak memory of converting paths in memory, inf if unknown."""
+    json_bytes = 0
+    for path in paths:
+        if otel_file_compression(path):
+            return math.inf
+        size = os.path.getsize(path)
+        if otel_file_format(path) == "proto":
+            size *= JSON_BYTES_PER_PROTO_BYTE
+        json_bytes += size
+    return json_bytes * IN_MEMORY_BYTES_PER_FILE_BYTE
+
+
+def _dbnl_df_from_otel_files_spilled(paths, memory_budget, options, dedupe=None):
+    chunk_bytes = max(memory_budget // IN_MEMORY_BYTES_PER_FILE_BYTE, 1)
+    abs_paths = [os.path.abspath(p) for p in paths]
+    frames = []
+    with tempfile.TemporaryDirectory(prefix="dbnl_spill_") as spill_dir:
+        db = sqlite3.connect(os.path.join(spill_dir, "spans.sqlite"))
+        try:
+            # Scratch database, dropped with the directory
+            db.execute("PRAGMA journal_mode = OFF")
+            db.execute("PRAGMA synchronous = OFF")
+            db.execute(
+                "CREATE TABLE spans "
+                "(trace_id TEXT, payload TEXT, file_no INTEGER, offset INTEGER, "
+                "length INTEGER)"
+            )
+
+            # Spill one row per trace per line; nothing is grouped in memory
+            for file_no, segment_path in enumerate(paths):
+                proto = otel_file_format(segment_path) == "proto"
+                for line, (_, offset, length) in _read_records(segment_path):
+                    payload_by_trace = group_resource_spans_by_trace_id(
+                        [_dedupe_payload(dedupe, _load_payload(line, proto))]
+                    )
+                    db.executemany(
+                        "INSERT INTO spans VALUES (?, ?, ?, ?, ?)",
+                        [
+                            (trace_id, json.dumps(p), file_no, offset, length)
+                            for trace_id, p in payload_by_trace.items()
+                        ],
+                    )
+            db.commit()
+            db.execute("CREATE INDEX spans_by_trace_id ON spans (trace_id)")
+
+            # Read back grouped by trace, in file order within each trace, and
+            # convert whenever a chunk of whole traces reaches the budget
+            rows = db.execute(
+                "SELECT trace_id, payload, file_no, offset, length FROM spans "
+                "ORDER BY trace_id, rowid"
+            )
+            payloads, line_refs, chunk_size = [], [], 0
+            for _, trace_rows in groupby(rows, key=itemgetter(0)):
+                if chunk_size >= chunk_bytes:
+                    frames.append(
+                        _dbnl_df_from_raw_spans(
+                            pd.Series(payloads), line_refs, **options
+                        )
+                    )
+                    payloads, line_refs, chunk_size = [], [], 0
+                for _, payload, file_no, offset, length in trace_rows:
+                    payloads.append(json.loads(payload))
+                    line_refs.append(((abs_paths[file_no], offset, length),))
+                    chunk_size += len(payload)
+            if payloads:
+                frames.append(
+                    _dbnl_df_from_raw_spans(pd.Series(payloads), line_refs, **options)
+                )
+        finally:
+            db.close()
+
+    if not frames:
+        return _empty_dbnl_df(**options)
+    return _concat_dbnl_frames(frames, options["traces_data_format"])
+
+
+def _concat_dbnl_frames(frames, traces_data_format):
+    """Concatenate frames of disjoint traces, sorted by trace_id as in serial runs."""
+    dbnl_df = pd.concat(
+        [frame.drop(columns="traces_data") for frame in frames], ignore_index=True
+    )
+    if traces_data_format == "arrow":
+        # Each frame inferred its own struct type; merge them into one
+        dbnl_df["traces_data"] = pd.arrays.ArrowExtensionArray(
+            pa.concat_tables(
+                [pa.table({"traces_data": frame["traces_data"]}) for frame in frames],
+                promote_options="permissive",
+            ).column("traces_data")
+        )
+    else:
+        dbnl_df["traces_data"] = [t for frame in frames for t in frame["traces_data"]]
+
+    # Match the trace_id ordering of the serial groupby
+    return dbnl_df[frames[0].columns].sort_values("trace_id", ignore_index=True)
+
+
+def list_otel_files(path):
+    """
+    Resolve a file, directory or glob to collector files in the order they were written.
+
+    A directory expands to the *.jsonl and protobuf *.binpb files in it, plus
+    compressed ones such as *.jsonl.gz, *.jsonl.bz2 and *.jsonl.zst. Backups made
+    by the collector's file rotation carry a timestamp in their name
+    (traces-2025-10-11T16-49-50.123.jsonl) and are ordered by it, oldest first;
+    files without one, such as the active traces.jsonl, follow by modification
+    time.
+    """
+    if os.path.isdir(path):
+        paths = [
+            p
+            for extension in ("*.jsonl", "*.binpb")
+            for suffix in ("", *COMPRESSION_SUFFIXES)
+            for p in glob.glob(os.path.join(path, extension + suffix))
+        ]
+    elif glob.has_magic(path):
+        paths = glob.glob(path)
+    else:
+        return [path]
+
+    if not paths:
+        raise FileNotFoundError(f"No OTEL trace files match {path!r}")
+    return sorted(paths, key=_rotation_sort_key)
+
+
+def _rotation_sort_key(path):
+    name = os.path.basename(path)
+    match = ROTATION_TIMESTAMP_PATTERN.search(name)
+    if match:
+        return (0, match.group(0), name)
+    return (1, os.path.getmtime(path), name)
+
+
+def _otel_file_cache_key(paths, *options):
+    digest = hashlib.sha256(repr((CACHE_VERSION, *options)).encode())
+    for path in paths:
+        stat = os.stat(path)
+        identity = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest.update(repr(identity).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read(CACHE_SAMPLE_BYTES))
+            if stat.st_size > CACHE_SAMPLE_BYTES:
+                f.seek(max(stat.st_size - CACHE_SAMPLE_BYTES, CACHE_SAMPLE_BYTES))
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _read_cached_df(cache_path, traces_data_format="dict", dedupe_spans=True):
+    table = pq.read_table(cache_path)
+    if "spans" not in table.column_names:
+        dbnl_df = table.to_pandas()
+    else:
+        # pandas cannot rebuild the nested spans dtype from the Parquet metadata,
+        # so keep that column as the Arrow-backed array convert_otlp_traces_data
+        # returns and convert the rest without it
+        spans = table.column("spans")
+        dbnl_df = table.drop_columns(["spans"]).to_pandas(ignore_metadata=True)
+        dbnl_df["spans"] = pd.arrays.ArrowExtensionArray(spans)
+        # Restore what the pandas metadata skipped above held: attrs
+        # (duplicate_spans_dropped) and the nullable metric dtypes
+        dbnl_df.attrs = json.loads(table.schema.metadata.get(b"PANDAS_ATTRS", b"{}"))
+        dbnl_df = dbnl_df.astype(
+            {c: t for c, t in TRACE_METRIC_DTYPES.items() if c in dbnl_df}
+        )
+    for column in CACHE_JSON_COLUMNS:
+        if column in dbnl_df:
+            dbnl_df[column] = [json.loads(v) for v in dbnl_df[column]]
+    if traces_data_format == "arrow":
+        dbnl_df["traces_data"] = _arrow_traces_data(list(dbnl_df["traces_data"]))
+    elif traces_data_format == "lazy":
+        dbnl_df["traces_data"] = [
+            TraceDataRef(trace_id, [tuple(line) for line in lines], dedupe_spans)
+            for trace_id, lines in dbnl_df["traces_data"]
+        ]
+    return dbnl_df
+
+
+def _write_cached_df(
+    dbnl_df, cache_dir, cache_path, max_bytes, traces_data_format="dict"
+):
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # traces_data is heterogeneous nested OTLP and the name/model counts have
+    # per-trace keys, so store them as JSON text
+    cached = dbnl_df.copy()
+    if traces_data_format == "lazy":
+        # File offsets stay valid while the cache key (file signature) matches
+        cached["traces_data"] = [[r.trace_id, r.lines] for r in cached["traces_data"]]
+    else:
+        cached["traces_data"] = traces_data_dicts(cached["traces_data"])
+    for column in CACHE_JSON_COLUMNS:
+        if column in cached:
+            cached[column] = [json.dumps(v) for v in cached[column]]
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    cached.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, cache_path)
+
+    # Evict least recently used entries beyond max_bytes, keeping the newest
+    entries = sorted(
+        (e for e in os.scandir(cache_dir) if e.name.endswith(".parquet")),
+        key=lambda e: e.stat().st_mtime_ns,
+        reverse=True,
+    )
+    total = 0
+    for entry in entries:
+        total += entry.stat().st_size
+        if total > max_bytes and entry.path != cache_path:
+            os.remove(entry.path)
+
+
+def _newline_aligned_ranges(path, count):
+    """Split a file into at most count (start, end) byte ranges of whole lines."""
+    if otel_file_compression(path) or otel_file_format(path) == "proto":
+        # Compressed streams and protobuf records cannot be entered mid-way
+        return [(0, None)]
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, count):
+            f.seek(max(size * i // count, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def _partition_byte_range(path, start, end, partitions):
+    """Group the spans in one byte range by trace and hash-partition the traces."""
+    payloads = []
+    lines_by_trace = defaultdict(list)  # for lazy traces_data
+    proto = otel_file_format(path) == "proto"
+    for line, line_ref in _read_records(path, start, end):
+        payloads.append(_load_payload(line, proto))
+        for trace_id in _span_trace_ids(payloads[-1]):
+            lines_by_trace[trace_id].append(line_ref)
+
+    # crc32 rather than hash() so every process agrees on the partition
+    by_partition = [[] for _ in range(partitions)]
+    for trace_id, trace_payload in group_resource_spans_by_trace_id(payloads).items():
+        by_partition[zlib.crc32(trace_id.encode()) % partitions].append(
+            (trace_payload, tuple(lines_by_trace[trace_id]))
+        )
+
+    # Pickled once here so the parent only forwards bytes to the reducers
+    return [pickle.dumps(trace_payloads) for trace_payloads in by_partition]
+
+
+def _dbnl_df_from_pickled_partition(pickled_chunks, options, dedupe_max_exact):
+    """The partition's frame (None if empty) and its dropped duplicate spans."""
+    items = [item for chunk in pickled_chunks for item in pickle.loads(chunk)]
+    if dedupe_max_exact:
+        # Every copy of a span is in its trace's partition, in file order
+        dedupe = SpanDeduplicator(dedupe_max_exact)
+        items = [(dedupe.filter(payload), refs) for payload, refs in items]
+        items = [item for item in items if item[0]["resourceSpans"]]
+    dropped = dedupe.dropped if dedupe_max_exact else 0
+    if not items:
+        return None, dropped
+    trace_payloads, line_refs = zip(*items)
+    return (
+        _dbnl_df_from_raw_spans(pd.Series(list(trace_payloads)), line_refs, **options),
+        dropped,
+    )
+
+
+def _dbnl_df_from_otel_files_parallel(paths, workers, options, dedupe_max_exact=0):
+    # Every file gets its share of byte ranges, kept in file order; compressed
+    # segments are decompressed in parallel, one per process
+    ranges_per_file = -(-workers // len(paths))
+    ranges = [
+        (path, start, end)
+        for path in paths
+        for start, end in _newline_aligned_ranges(path, ranges_per_file)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Map: parse each byte range and route its traces to partitions
+        mapped = list(
+            pool.map(
+                _partition_byte_range,
+                [path for path, _, _ in ranges],
+                [start for _, start, _ in ranges],
+                [end for _, _, end in ranges],
+                repeat(workers),
+            )
+        )
+
+        # Reduce: each partition holds whole traces, in file order across ranges
+        reduced = list(
+            pool.map(
+                _dbnl_df_from_pickled_partition,
+                [[chunks[i] for chunks in mapped] for i in range(workers)],
+                repeat(options),
+                repeat(dedupe_max_exact),
+            )
+        )
+        frames = [frame for frame, _ in reduced if frame is not None]
+
+    dropped = sum(dropped for _, dropped in reduced)
+    return _concat_dbnl_frames(frames, options["traces_data_format"]), dropped
+
+
+def iter_dbnl_frames(
+    path,
+    traces_per_chunk=1000,
+    include_spans=False,
+    include_metrics=False,
+    traces_data_format="dict",
+    dedupe_spans=True,
+):
+    """
+    Stream collector files as DBNL dataframes of complete traces.
+
+    Args:
+        path: Path to the JSONL file containing OTEL traces, or a directory or glob
+              of rotated collector files, as in dbnl_df_from_otel_file
+        traces_per_chunk: Minimum number of complete traces per yielded dataframe
+                          (the last chunk may be smaller).
+        include_spans: Add the converted "spans" column, as in dbnl_df_from_otel_file.
+        include_metrics: Add the per-trace metric columns, as in dbnl_df_from_otel_file.
+        traces_data_format: "dict", "arrow" or "lazy", as in dbnl_df_from_otel_file.
+        dedupe_spans: Drop repeated (traceId, spanId) spans, as in
+                      dbnl_df_from_otel_file.
+
+    Yields:
+        DataFrames with the same columns as dbnl_df_from_otel_file. Every trace
+        appears in exactly one chunk with all of its spans, so
+        pd.concat(chunks).sort_values("trace_id", ignore_index=True) matches
+        dbnl_df_from_otel_file(path). attrs["duplicate_spans_dropped"] counts the
+        duplicates dropped so far.
+
+    Only the lines of traces that are still open are held in memory, plus a
+    trace_id -> line number index built by a regex pre-scan of the files.
+    """
+    options = _convert_options(
+        include_spans, include_metrics, traces_data_format, dedupe_spans
+    )
+
+    paths = list_otel_files(path)
+
+    # First pass: the last line each trace_id appears on, without decoding JSON;
+    # lines are numbered across all files, so traces crossing a rotation stay whole
+    last_line_by_trace = {}
+    for line_no, (line, proto, _) in enumerate(_read_file_records(paths)):
+        for trace_id in _record_trace_ids(line, proto):
+            last_line_by_trace[trace_id] = line_no
+
+    closing_traces = defaultdict(list)
+    for trace_id, line_no in last_line_by_trace.items():
+        closing_traces[line_no].append(trace_id)
+    del last_line_by_trace
+
+    # Second pass: buffer each trace's spans until its last line has been read
+    dedupe = SpanDeduplicator() if dedupe_spans else None
+    open_traces = defaultdict(list)  # trace_id -> (single-trace payload, line refs)
+    ready = []
+    ready_count = 0
+    for line_no, (line, proto, line_ref) in enumerate(_read_file_records(paths)):
+        payload = _dedupe_payload(dedupe, _load_payload(line, proto))
+        payload_by_trace = group_resource_spans_by_trace_id([payload])
+        for trace_id, trace_payload in payload_by_trace.items():
+            open_traces[trace_id].append((trace_payload, (line_ref,)))
+
+        for trace_id in closing_traces.pop(line_no, []):
+            if trace_id in open_traces:
+                ready.extend(open_traces.pop(trace_id))
+                ready_count += 1
+
+        if ready_count >= traces_per_chunk:
+            yield _dbnl_df_from_ready(ready, options, dedupe)
+            ready = []
+            ready_count = 0
+
+    # Anything the pre-scan missed is complete once the files have been read
+    for items in open_traces.values():
+        ready.extend(items)
+    if ready:
+        yield _dbnl_df_from_ready(ready, options, dedupe)
+
+
+def _read_file_records(paths):
+    """Records of every file in order, with whether it is protobuf and the ref."""
+    for segment_path in paths:
+        proto = otel_file_format(segment_path) == "proto"
+        for record, line_ref in _read_records(segment_path):
+            yield record, proto, line_ref
+
+
+def _dbnl_df_from_ready(ready, options, dedupe):
+    payloads, line_refs = zip(*ready)
+    dbnl_df = _dbnl_df_from_raw_spans(pd.Series(list(payloads)), line_refs, **options)
+    dbnl_df.attrs["duplicate_spans_dropped"] = dedupe.dropped if dedupe else 0
+    return dbnl_df
+
+
+def dbnl_df_from_otel_file_incremental(
+    path,
+    checkpoint_path,
+    include_spans=False,
+    include_metrics=False,
+    traces_data_format="dict",
+    watermark_delay=None,
+    max_pending_spans=None,
+    dedupe_spans=True,
+    dedupe_max_exact=DEDUPE_MAX_EXACT_SPANS,
+):
+    """
+    Convert only the traces that completed since the previous call.
+
+    Args:
+        path: Path to the JSONL file the collector appends to
+        checkpoint_path: JSON file holding the last processed byte offset, the
+                         identity of the file it belongs to, and the spans of
+                         traces that are still open. Created on the first call.
+        include_spans: Add the converted "spans" column, as in dbnl_df_from_otel_file.
+        include_metrics: Add the per-trace metric columns, as in dbnl_df_from_otel_file.
+        traces_data_format: "dict" or "arrow", as in dbnl_df_from_otel_file. Lazy
+                            references are not supported, as the spans of open
+                            traces are kept in the checkpoint rather than the file.
+        watermark_delay: Optional event-time lateness, as anything pd.Timedelta
+                         accepts. The watermark is the latest span end time read
+                         so far minus this delay; open traces whose spans all
+                         ended before it are emitted without waiting for their
+                         root span.
+        max_pending_spans: Optional cap on the spans of open traces kept in the
+                           checkpoint. Above it, the traces that ended earliest are
+                           emitted incomplete until the rest fit.
+        dedupe_spans: Drop repeated (traceId, spanId) spans, as in
+                      dbnl_df_from_otel_file. Besides this call's spans, those of
+                      open traces and of the traces emitted by the previous call
+                      (kept in the checkpoint) count as seen, which covers
+                      exporter retries; a span repeated after that is not caught.
+        dedupe_max_exact: As in dbnl_df_from_otel_file.
+
+    Returns:
+        DataFrame with the same columns as dbnl_df_from_otel_file, holding the
+        traces whose root span (no parentSpanId) has been read, plus open traces
+        forced out by the watermark or the cap. attrs["traces_expired_by_watermark"]
+        and attrs["traces_evicted_by_memory_cap"] count the latter, and
+        attrs["duplicate_spans_dropped"] the spans dropped by dedupe_spans. Spans of
+        other traces are carried over in the checkpoint, across runs, until their
+        root arrives; spans arriving after their trace was emitted come out later
+        as a separate incomplete trace.
+
+    Only bytes appended since the checkpoint are read, up to the last complete
+    line. If the file was truncated or replaced, it is read again from the start;
+    when the collector rotated it by renaming, the rest of the renamed file in
+    the same directory is read first.
+    """
+    options = _convert_options(
+        include_spans,
+        include_metrics,
+        traces_data_format,
+        dedupe_spans,
+        formats=("dict", "arrow"),
+    )
+    if otel_file_compression(path) or otel_file_format(path) == "proto":
+        raise ValueError(
+            f"Can only tail uncompressed JSON lines, not {path!r}: new data is "
+            "found by byte offset"
+        )
+    checkpoint = _load_tail_checkpoint(checkpoint_path)
+    open_traces = defaultdict(list, checkpoint["open_traces"])
+    # Event time: the latest span end of each open trace, and of everything read
+    trace_end_ns = checkpoint.get("trace_end_ns") or {
+        trace_id: _max_end_ns(payloads) for trace_id, payloads in open_traces.items()
+    }
+    max_end_ns = checkpoint.get("max_end_ns", max(trace_end_ns.values(), default=0))
+    dedupe = SpanDeduplicator(dedupe_max_exact) if dedupe_spans else None
+    if dedupe is not None:
+        dedupe.add_keys(checkpoint.get("emitted_span_keys", []))
+        for payloads in open_traces.values():
+            dedupe.add_keys(_span_keys(payloads))
+
+    stat = os.stat(path)
+    file_id = [stat.st_dev, stat.st_ino]
+    segments = []  # (path, start offset), oldest data first
+    if (
+        checkpoint["file_id"] == file_id
+        and stat.st_size >= checkpoint["offset"]
+        and _head_sha256(path, checkpoint["offset"]) == checkpoint["head_sha256"]
+    ):
+        segments.append((path, checkpoint["offset"]))
+    else:
+        rotated_path = _find_file_by_id(
+            os.path.dirname(os.path.abspath(path)), checkpoint["file_id"]
+        )
+        if rotated_path is not None and rotated_path != os.path.abspath(path):
+            segments.append((rotated_path, checkpoint["offset"]))
+        segments.append((path, 0))
+
+    completed = set()
+    for segment_path, start in segments:
+        lines, offset = _read_complete_lines(segment_path, start)
+        for line in filter(bytes.strip, lines):
+            payload_by_trace = group_resource_spans_by_trace_id(
+                [_dedupe_payload(dedupe, json.loads(line))]
+            )
+            for trace_id, trace_payload in payload_by_trace.items():
+                open_traces[trace_id].append(trace_payload)
+                end_ns = _max_end_ns([trace_payload])
+                trace_end_ns[trace_id] = max(trace_end_ns.get(trace_id, 0), end_ns)
+                max_end_ns = max(max_end_ns, end_ns)
+                if _has_root_span(trace_payload):
+                    completed.add(trace_id)
+
+    # Still open traces, oldest event time first
+    pending = sorted(
+        (end_ns, trace_id)
+        for trace_id, end_ns in trace_end_ns.items()
+        if trace_id not in completed
+    )
+    expired = []
+    if watermark_delay is not None:
+        watermark_ns = max_end_ns - pd.Timedelta(watermark_delay).value
+        expired = [trace_id for end_ns, trace_id in pending if end_ns < watermark_ns]
+        pending = pending[len(expired) :]
+    evicted = []
+    if max_pending_spans is not None:
+        span_counts = [_span_count(open_traces[trace_id]) for _, trace_id in pending]
+        pending_spans = sum(span_counts)
+        for (_, trace_id), span_count in zip(pending, span_counts):
+            if pending_spans <= max_pending_spans:
+                break
+            evicted.append(trace_id)
+            pending_spans -= span_count
+
+    ready = []
+    for trace_id in [*completed, *expired, *evicted]:
+        ready.extend(open_traces.pop(trace_id))
+        del trace_end_ns[trace_id]
+
+    _save_tail_checkpoint(
+        checkpoint_path,
+        {
+            "file_id": file_id,
+            "offset": offset,
+            "head_sha256": _head_sha256(path, offset),
+            "open_traces": open_traces,
+            "trace_end_ns": trace_end_ns,
+            "max_end_ns": max_end_ns,
+            "emitted_span_keys": _span_keys(ready) if dedupe_spans else [],
+        },
+    )
+
+    if ready:
+        dbnl_df = _dbnl_df_from_raw_spans(pd.Series(ready), **options)
+    else:
+        dbnl_df = _empty_dbnl_df(**options)
+    dbnl_df.attrs["traces_expired_by_watermark"] = len(expired)
+    dbnl_df.attrs["traces_evicted_by_memory_cap"] = len(evicted)
+    dbnl_df.attrs["duplicate_spans_dropped"] = dedupe.dropped if dedupe else 0
+    return dbnl_df
+
+
+def _load_tail_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {"file_id": None, "offset": 0, "head_sha256": None, "open_traces": {}}
+    with open(checkpoint_path, "r") as f:
+        return json.load(f)
+
+
+def _save_tail_checkpoint(checkpoint_path, checkpoint):
+    tmp_path = f"{checkpoint_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _head_sha256(path, length):
+    """Hash of the first bytes of a file, used to detect in-place rewrites."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(min(length, TAIL_HEAD_BYTES))).hexdigest()
+
+
+def _find_file_by_id(directory, file_id):
+    if file_id is None:
+        return None
+    for entry in os.scandir(directory):
+        stat = entry.stat(follow_symlinks=False)
+        if [stat.st_dev, stat.st_ino] == file_id:
+            return entry.path
+    return None
+
+
+def _read_complete_lines(path, start):
+    """Lines from start up to the last newline, and the offset just past it."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end].splitlines(), start + end
+
+
+def _max_end_ns(payloads):
+    return max(
+        (
+            int(span.get("endTimeUnixNano", 0))
+            for payload in payloads
+            for rs in payload.get("resourceSpans", [])
+            for ss in rs.get("scopeSpans", [])
+            for span in ss.get("spans", [])
+        ),
+        default=0,
+    )
+
+
+def _span_count(payloads):
+    return sum(
+        len(ss.get("spans", []))
+        for payload in payloads
+        for rs in payload.get("resourceSpans", [])
+        for ss in rs.get("scopeSpans", [])
+    )
+
+
+def _has_root_span(payload):
+    return any(
+        not span.get("parentSpanId")
+        for rs in payload.get("resourceSpans", [])
+        for ss in rs.get("scopeSpans", [])
+        for span in ss.get("spans", [])
+    )
+
+
+def build_trace_index(path, index_path=None):
+    """
+    Write a sidecar index mapping each traceId to the lines holding its spans.
+
+    Args:
+        path: Path to the JSONL file containing OTEL traces
+        index_path: Where to write the index (default: path + ".tidx")
+
+    Returns:
+        The index path. The index is built in one streaming pass without decoding
+        JSON and stores fixed-size (trace id, line offset, line length) records
+        sorted by trace id, so lookups are a binary search over the mapped file.
+        Trace ids that are not 16 bytes of hex are not indexed.
+    """
+    if otel_file_compression(path) or otel_file_format(path) == "proto":
+        raise ValueError(
+            f"Can only index uncompressed JSON lines, not {path!r}: lookups map "
+            "the file directly"
+        )
+    index_path = index_path or path + TRACE_INDEX_SUFFIX
+    records = []
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            for trace_id in set(TRACE_ID_BYTES_PATTERN.findall(line)):
+                if len(trace_id) == 32:
+                    records.append(
+                        (bytes.fromhex(trace_id.decode()), offset, len(line))
+                    )
+            offset += len(line)
+    records.sort()
+
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(TRACE_INDEX_HEADER.pack(TRACE_INDEX_MAGIC, TRACE_INDEX_VERSION, offset))
+        for record in records:
+            f.write(TRACE_INDEX_RECORD.pack(*record))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def _unindexed_trace_lines(path, start, trace_id):
+    """(offset, length) of the complete lines from start that hold trace_id."""
+    trace_id_bytes = trace_id.encode()
+    lines = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # still being written
+            if trace_id_bytes in line and trace_id_bytes in set(
+                TRACE_ID_BYTES_PATTERN.findall(line)
+            ):
+                lines.append((offset, len(line)))
+            offset += len(line)
+    return lines
+
+
+def trace_data_from_index(path, trace_id, index_path=None, dedupe_spans=True):
+    """
+    Rebuild one trace's {"resourceSpans": [...]} using a build_trace_index sidecar.
+
+    Only the lines listed for trace_id are read from the memory-mapped JSONL file
+    and decoded. Lines the collector appended after the index was built are
+    scanned for trace_id without decoding, so the trace is returned whole;
+    rebuild the index once that tail grows large. Repeated (traceId, spanId)
+    spans are dropped unless dedupe_spans=False. Returns None if the trace is in
+    neither.
+    """
+    index_path = index_path or path + TRACE_INDEX_SUFFIX
+    key = bytes.fromhex(trace_id)
+
+    with open(index_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index:
+            magic, version, indexed_size = TRACE_INDEX_HEADER.unpack_from(index)
+            if magic != TRACE_INDEX_MAGIC or version != TRACE_INDEX_VERSION:
+                raise ValueError(f"{index_path} is not a trace index")
+            if os.path.getsize(path) < indexed_size:
+                raise ValueError(f"{index_path} is stale: {path} has been truncated")
+
+            def record(i):
+                return TRACE_INDEX_RECORD.unpack_from(
+                    index, TRACE_INDEX_HEADER.size + i * TRACE_INDEX_RECORD.size
+                )
+
+            # Binary search for the first record of trace_id
+            count = (len(index) - TRACE_INDEX_HEADER.size) // TRACE_INDEX_RECORD.size
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if record(mid)[0] < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+
+            lines = []
+            while lo < count and record(lo)[0] == key:
+                lines.append(record(lo)[1:])
+                lo += 1
+
+    lines.extend(_unindexed_trace_lines(path, indexed_size, trace_id))
+    if not lines:
+        return None
+
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            payloads = [json.loads(data[start : start + size]) for start, size in lines]
+    if dedupe_spans:
+        dedupe = SpanDeduplicator()
+        payloads = [dedupe.filter(payload) for payload in payloads]
+
+    return group_resource_spans_by_trace_id(payloads).get(trace_id)
@@ -1,8 +1,26 @@
 import dbnl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import hashlib
 import json
+import os
 from collections import defaultdict
 
+# Sidecar scope catalog: a header line, then one [offset, length, {scope name:
+# [trace ids]}] line per cataloged line of the traces file
+SCOPE_CATALOG_SUFFIX = ".scopes"
+SCOPE_CATALOG_VERSION = 1
+
+
+def _fingerprint(obj, fingerprints):
+    """Stable key for a resource/scope dict, serialized once per distinct object."""
+    entry = fingerprints.get(id(obj))
+    if entry is None:
+        # Keep a reference to obj so its id() cannot be reused while cached
+        entry = fingerprints[id(obj)] = (json.dumps(obj, sort_keys=True), obj)
+    return entry[0]
+
 
 def group_resource_spans_by_trace_id(raw_spans_series):
     """
@@ -11,80 +29,102 @@ def group_resource_spans_by_trace_id(raw_spans_series):
 
     Returns:
         dict[trace_id] -> {"resourceSpans": [...]}
+
+    Resource and scope objects are shared by reference between traces, so
+    treat the returned structures as read-only.
+    """
+    traces_by_id, _ = _group_and_filter_by_scope(raw_spans_series)
+    return traces_by_id
+
+
+def _group_and_filter_by_scope(payloads, scope_filter=None):
+    """
+    Group spans by trace_id and cut payloads down to one scope in a single pass.
+
+    Returns:
+        (traces_by_id, scope_payloads): traces_by_id as in
+        group_resource_spans_by_trace_id, limited to traces with at least one
+        span from scope_filter, with ALL of their spans. scope_payloads are the
+        payloads reduced to scope_filter's scopeSpans. With scope_filter=None
+        every trace is kept and scope_payloads are the payloads themselves.
     """
-    # trace_id -> ( (resource_key, scope_key) -> scopeSpanInfo )
-    grouped = defaultdict(lambda: {})
+    fingerprints = {}  # id(obj) -> (fingerprint, obj)
+    interned = {}  # fingerprint -> first object seen with that content
+
+    # trace_id -> ( (resource_key, scope_key) -> spans )
+    grouped = defaultdict(dict)
+    scope_trace_ids = set()
+    scope_payloads = []
 
-    for payload in raw_spans_series:
+    for payload in payloads:
+        scope_resource_spans = []
         for rs in payload.get("resourceSpans", []):
             resource = rs.get("resource", {})
-            resource_key = json.dumps(resource, sort_keys=True)
+            resource_key = _fingerprint(resource, fingerprints)
+            interned.setdefault(resource_key, resource)
 
+            scope_spans = []
             for ss in rs.get("scopeSpans", []):
                 scope = ss.get("scope", {})
-                scope_key = json.dumps(scope, sort_keys=True)
+                scope_key = _fingerprint(scope, fingerprints)
+                interned.setdefault(scope_key, scope)
+                in_scope = scope_filter and scope.get("name") == scope_filter
+                if in_scope:
+                    scope_spans.append(ss)
 
                 for span in ss.get("spans", []):
                     trace_id = span.get("traceId")
                     if trace_id is None:
                         continue
+                    if in_scope:
+                        scope_trace_ids.add(trace_id)
 
                     # For each trace_id, maintain resource+scope buckets
                     trace_bucket = grouped[trace_id]
                     rs_scope_key = (resource_key, scope_key)
 
                     if rs_scope_key not in trace_bucket:
-                        trace_bucket[rs_scope_key] = {
-                            "resource": resource,
-                            "scope": scope,
-                            "spans": [],
-                        }
+                        trace_bucket[rs_scope_key] = []
 
-                    trace_bucket[rs_scope_key]["spans"].append(span)
+                    trace_bucket[rs_scope_key].append(span)
+
+            if scope_spans:
+                scope_resource_spans.append(
+                    {"resource": resource, "scopeSpans": scope_spans}
+                )
+
+        if not scope_filter:
+            scope_payloads.append(payload)
+        elif scope_resource_spans:
+            scope_payloads.append({"resourceSpans": scope_resource_spans})
 
     # Build final OTLP-style structures
     traces_by_id = {}
 
     for trace_id, rs_scope_map in grouped.items():
-        resourceSpans = []
+        if scope_filter and trace_id not in scope_trace_ids:
+            continue
 
-        # rs_scope_map: (resource_key, scope_key) -> {resource, scope, spans}
+        # rs_scope_map: (resource_key, scope_key) -> spans
         # We need to group by resource, then within each, group by scope
-        by_resource = defaultdict(list)
-        for (_res_key, _scope_key), info in rs_scope_map.items():
-            by_resource[json.dumps(info["resource"], sort_keys=True)].append(info)
-
-        for _res_key, scope_infos in by_resource.items():
-            # For each distinct resource, collect its scopeSpans
-            scopeSpans = []
-            # group by scope to keep shape scope + spans[]
-            by_scope = defaultdict(list)
-            for info in scope_infos:
-                by_scope[json.dumps(info["scope"], sort_keys=True)].extend(
-                    info["spans"]
-                )
-
-            for scope_json, spans in by_scope.items():
-                scope = json.loads(scope_json)
-                scopeSpans.append(
-                    {
-                        "scope": scope,
-                        "spans": spans,
-                    }
-                )
+        by_resource = defaultdict(dict)
+        for (res_key, scope_key), spans in rs_scope_map.items():
+            by_resource[res_key][scope_key] = spans
 
-            # All scopeSpans share the same resource
-            resource = json.loads(_res_key)
-            resourceSpans.append(
+        traces_by_id[trace_id] = {
+            "resourceSpans": [
                 {
-                    "resource": resource,
-                    "scopeSpans": scopeSpans,
+                    "resource": interned[res_key],
+                    "scopeSpans": [
+                        {"scope": interned[scope_key], "spans": spans}
+                        for scope_key, spans in by_scope.items()
+                    ],
                 }
-            )
+                for res_key, by_scope in by_resource.items()
+            ]
+        }
 
-        traces_by_id[trace_id] = {"resourceSpans": resourceSpans}
-
-    return traces_by_id
+    return traces_by_id, scope_payloads
 
 
 def get_from_attrs(attrs, key):
@@ -113,7 +153,12 @@ def get_from_attrs(attrs, key):
     return None
 
 
-def dbnl_df_from_otel_file(path, scope_filter="nat_calculator"):
+def dbnl_df_from_otel_file(
+    path,
+    scope_filter="nat_calculator",
+    use_catalog=False,
+    root_span_name="calculator_agent",
+):
     """
     Load OTEL traces from a JSONL file and convert to DBNL dataframe.
 
@@ -123,133 +168,187 @@ def dbnl_df_from_otel_file(path, scope_filter="nat_calculator"):
                      The traces_data will include ALL spans sharing the same trace_id,
                      including child spans from other scopes (e.g., GenerateContent from OpenInference).
                      Set to None to include all traces.
+        use_catalog: Keep a scope catalog next to the file (see
+                     build_scope_catalog) and only read the lines holding spans of
+                     matching traces. The catalog is extended with lines appended
+                     since the last call, so the first call costs an extra pass.
+        root_span_name: Name of the workflow span in scope_filter whose input.value
+                        and output.value become the input and output columns
+                        (default: "calculator_agent").
     """
-    with open(path, "r") as f:
-        all_raw_spans = pd.Series([json.loads(line) for line in f])
-
-    if len(all_raw_spans) == 0:
+    line_ranges = None
+    if use_catalog and scope_filter:
+        line_ranges = _catalog_line_ranges(build_scope_catalog(path), scope_filter)
+
+    # One streaming pass builds the full traces (ALL spans sharing a trace_id,
+    # including child spans from other scopes) and, for input/output
+    # extraction, the payloads cut down to the filtered scope
+    traces_by_id, scope_payloads = _group_and_filter_by_scope(
+        (json.loads(line) for line in _read_lines(path, line_ranges)), scope_filter
+    )
+
+    if not scope_payloads:
         return pd.DataFrame(
             columns=["trace_id", "input", "output", "timestamp", "traces_data"]
         )
 
-    # First, find trace_ids that have spans from the filtered scope
-    if scope_filter:
-        filtered_trace_ids = set()
-        for payload in all_raw_spans:
-            for rs in payload.get("resourceSpans", []):
-                for ss in rs.get("scopeSpans", []):
-                    scope = ss.get("scope", {})
-                    if scope.get("name") == scope_filter:
-                        for span in ss.get("spans", []):
-                            filtered_trace_ids.add(span.get("traceId"))
-
-        if not filtered_trace_ids:
-            return pd.DataFrame(
-                columns=["trace_id", "input", "output", "timestamp", "traces_data"]
-            )
-
-        # Filter to include ALL spans for matching trace_ids (includes child spans from other scopes)
-        filtered_spans = []
-        for payload in all_raw_spans:
-            filtered_resource_spans = []
-            for rs in payload.get("resourceSpans", []):
-                filtered_scope_spans = []
-                for ss in rs.get("scopeSpans", []):
-                    filtered_span_list = [
-                        span
-                        for span in ss.get("spans", [])
-                        if span.get("traceId") in filtered_trace_ids
-                    ]
-                    if filtered_span_list:
-                        filtered_scope_spans.append(
-                            {
-                                "scope": ss.get("scope", {}),
-                                "spans": filtered_span_list,
-                            }
-                        )
-                if filtered_scope_spans:
-                    filtered_resource_spans.append(
-                        {
-                            "resource": rs.get("resource", {}),
-                            "scopeSpans": filtered_scope_spans,
-                        }
-                    )
-            if filtered_resource_spans:
-                filtered_spans.append({"resourceSpans": filtered_resource_spans})
-        raw_spans = (
-            pd.Series(filtered_spans) if filtered_spans else pd.Series([], dtype=object)
-        )
-    else:
-        raw_spans = all_raw_spans
-
-    if len(raw_spans) == 0:
-        return pd.DataFrame(
-            columns=["trace_id", "input", "output", "timestamp", "traces_data"]
-        )
-
-    # For input/output extraction, only use spans from the filtered scope
-    if scope_filter:
-        scope_filtered_spans = []
-        for payload in raw_spans:
-            filtered_resource_spans = []
-            for rs in payload.get("resourceSpans", []):
-                filtered_scope_spans = []
-                for ss in rs.get("scopeSpans", []):
-                    scope = ss.get("scope", {})
-                    if scope.get("name") == scope_filter:
-                        filtered_scope_spans.append(ss)
-                if filtered_scope_spans:
-                    filtered_resource_spans.append(
-                        {
-                            "resource": rs.get("resource", {}),
-                            "scopeSpans": filtered_scope_spans,
-                        }
-                    )
-            if filtered_resource_spans:
-                scope_filtered_spans.append({"resourceSpans": filtered_resource_spans})
-        scope_filtered_raw = (
-            pd.Series(scope_filtered_spans)
-            if scope_filtered_spans
-            else pd.Series([], dtype=object)
-        )
-    else:
-        scope_filtered_raw = raw_spans
-
-    dbnl_spans = dbnl.convert_otlp_traces_data(data=scope_filtered_raw)
-    spans_df = pd.DataFrame(dbnl_spans.explode().tolist())
-    grouped_traces = spans_df.groupby("trace_id", dropna=False)
+    dbnl_spans = dbnl.convert_otlp_traces_data(data=pd.Series(scope_payloads))
+    spans = pc.list_flatten(pa.chunked_array(pa.array(dbnl_spans))).combine_chunks()
+    spans_df = pd.DataFrame(
+        {
+            "trace_id": spans.field("trace_id").to_pandas(),
+            "start_time": spans.field("start_time").to_pandas(),
+        }
+    )
 
     # earliest start_time per trace
-    timestamps = grouped_traces["start_time"].min().rename("timestamp")
-
-    # input: find the calculator_agent span's input.value
-    def get_input_from_trace(g):
-        for _, row in g.iterrows():
-            if row.get("name") == "calculator_agent":
-                val = get_from_attrs(row["attributes"], "input.value")
-                if val is not None:
-                    return val
-        return None
+    timestamps = (
+        spans_df.groupby("trace_id", dropna=False)["start_time"]
+        .min()
+        .rename("timestamp")
+    )
+
+    # input/output: looked up in the attributes map column of the root_span_name
+    # spans only, first value set per trace
+    is_root = pc.equal(spans.field("name"), root_span_name)
+    root_attributes = spans.field("attributes").filter(is_root)
+    key_type = root_attributes.type.key_type
+    root_spans = pd.DataFrame(
+        {
+            "trace_id": spans.field("trace_id").filter(is_root).to_pandas(),
+            "input": pc.map_lookup(
+                root_attributes, pa.scalar("input.value", key_type), "first"
+            ).to_pandas(),
+            "output": pc.map_lookup(
+                root_attributes, pa.scalar("output.value", key_type), "first"
+            ).to_pandas(),
+        }
+    )
+    by_trace = root_spans.groupby("trace_id").first().reindex(timestamps.index)
+    inputs, outputs = by_trace["input"], by_trace["output"]
 
-    # output: find the calculator_agent span's output.value
-    def get_output_from_trace(g):
-        for _, row in g.iterrows():
-            if row.get("name") == "calculator_agent":
-                val = get_from_attrs(row["attributes"], "output.value")
-                if val is not None:
-                    return val
-        return None
+    dbnl_df = pd.concat([inputs, outputs, timestamps], axis=1).reset_index()
+    dbnl_df["traces_data"] = dbnl_df["trace_id"].map(traces_by_id)
 
-    inputs = grouped_traces.apply(get_input_from_trace, include_groups=False)
-    inputs.name = "input"
+    return dbnl_df
 
-    outputs = grouped_traces.apply(get_output_from_trace, include_groups=False)
-    outputs.name = "output"
 
-    # traces_data includes ALL spans for the trace (including child spans from other scopes)
-    traces_by_id = group_resource_spans_by_trace_id(raw_spans)
+def build_scope_catalog(path, catalog_path=None):
+    """
+    Write or extend a sidecar catalog of the instrumentation scopes in a JSONL file.
 
-    dbnl_df = pd.concat([inputs, outputs, timestamps], axis=1).reset_index()
-    dbnl_df["traces_data"] = dbnl_df["trace_id"].map(traces_by_id)
+    Args:
+        path: Path to the JSONL file containing OTEL traces
+        catalog_path: Where to keep the catalog (default: path + ".scopes")
 
-    return dbnl_df
+    Returns:
+        The catalog path. For every complete line the catalog records its byte
+        offset and length and, per scope name, the trace ids of its spans. Only
+        lines appended since the last call are decoded; the catalog is rebuilt
+        if the file was truncated or replaced.
+    """
+    catalog_path = catalog_path or path + SCOPE_CATALOG_SUFFIX
+    header, entries, catalog_size = _load_scope_catalog(catalog_path)
+
+    with open(path, "rb") as f:
+        first_line = f.readline()
+        # An empty or partial first line (e.g. just after rotation) has no hash
+        # yet; the catalog is then reset to empty so stale ranges are not used
+        first_line_complete = first_line.endswith(b"\n")
+        file_header = {
+            "version": SCOPE_CATALOG_VERSION,
+            "first_line_sha256": hashlib.sha256(first_line).hexdigest()
+            if first_line_complete
+            else None,
+        }
+        offset = entries[-1][0] + entries[-1][1] if entries else 0
+        if header != file_header or os.path.getsize(path) < offset:
+            entries, offset = [], 0
+
+        new_entries = []
+        if first_line_complete:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                new_entries.append(
+                    [offset, len(line), _scope_trace_ids(json.loads(line))]
+                )
+                offset += len(line)
+
+    if not entries:
+        tmp_path = f"{catalog_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(json.dumps(file_header) + "\n")
+            _write_catalog_entries(f, new_entries)
+        os.replace(tmp_path, catalog_path)
+    elif new_entries:
+        os.truncate(catalog_path, catalog_size)
+        with open(catalog_path, "a") as f:
+            _write_catalog_entries(f, new_entries)
+    return catalog_path
+
+
+def _load_scope_catalog(catalog_path):
+    """
+    Header, entries and size in bytes of a catalog, up to its last complete line
+    (an interrupted append leaves a partial one, which is then overwritten).
+    """
+    if not os.path.exists(catalog_path):
+        return None, [], 0
+    with open(catalog_path, "rb") as f:
+        header_line = f.readline()
+        if not header_line.endswith(b"\n"):
+            return None, [], 0
+        header = json.loads(header_line)
+        entries = []
+        size = len(header_line)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            entries.append(json.loads(line))
+            size += len(line)
+    return header, entries, size
+
+
+def _write_catalog_entries(f, entries):
+    for entry in entries:
+        f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+def _scope_trace_ids(payload):
+    """{scope name: [trace ids]} for the spans of one payload."""
+    trace_ids = defaultdict(dict)  # dict keeps first-seen order
+    for rs in payload.get("resourceSpans", []):
+        for ss in rs.get("scopeSpans", []):
+            by_scope = trace_ids[ss.get("scope", {}).get("name", "")]
+            for span in ss.get("spans", []):
+                if span.get("traceId") is not None:
+                    by_scope[span["traceId"]] = None
+    return {name: list(ids) for name, ids in trace_ids.items()}
+
+
+def _catalog_line_ranges(catalog_path, scope_filter):
+    """(offset, length) of the lines holding spans of traces with a scope_filter span."""
+    _, entries, _ = _load_scope_catalog(catalog_path)
+    matched = {
+        trace_id
+        for _, _, scopes in entries
+        for trace_id in scopes.get(scope_filter, ())
+    }
+    return [
+        (offset, length)
+        for offset, length, scopes in entries
+        if any(not matched.isdisjoint(trace_ids) for trace_ids in scopes.values())
+    ]
+
+
+def _read_lines(path, line_ranges=None):
+    """Every line of the file, or only the (offset, length) line_ranges in order."""
+    with open(path, "rb") as f:
+        if line_ranges is None:
+            yield from f
+            return
+        for offset, length in line_ranges:
+            f.seek(offset)
+            yield f.read(length)